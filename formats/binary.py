@@ -3,6 +3,8 @@ import typing
 from io import BytesIO, SEEK_SET, SEEK_CUR, SEEK_END
 from typing import *
 
+import numpy as np
+
 __all__ = ["BinaryWriter", "BinaryReader", "BinaryEditor",
            "SEEK_SET", "SEEK_END", "SEEK_CUR"]
 
@@ -75,13 +77,30 @@ class _BaseBinaryWrapper:
         self.stream.seek(pos)
         return ret
 
+    def getbuffer(self) -> memoryview:
+        """
+        Gets a view over the data, without copying it if the data is in memory.
+
+        As with io.BytesIO.getbuffer, the view must be released before the data can be resized.
+        """
+        if isinstance(self.stream, BytesIO):
+            return self.stream.getbuffer()
+        return memoryview(self.getvalue())
+
     def align(self, alignment=4):
         if offset := (self.tell() % alignment):
             self.seek(self.tell() + alignment - offset)
 
     # some properties to make it more like the old BinaryReader
     @property
-    def data(self):
+    def data(self) -> bytes:
+        """
+        The data, as bytes.
+
+        Data in memory isn't copied: an io.BytesIO returns its own buffer while no getbuffer view is held (it's
+        only copied when written to afterwards), and a reader created from bytes returns them. Data in other
+        streams is read from them. Use getbuffer for a view which is never copied.
+        """
         return self.getvalue()
 
     @property
@@ -93,77 +112,314 @@ class _BaseBinaryWrapper:
         self.seek(value)
 
     def __len__(self):
-        return len(self.getvalue())
+        # The size of the data, which is also the furthest position written to, without copying the data
+        if isinstance(self.stream, BytesIO):
+            with self.stream.getbuffer() as buffer:
+                return buffer.nbytes
+        pos = self.stream.tell()
+        size = self.stream.seek(0, SEEK_END)
+        self.stream.seek(pos)
+        return size
+
+
+_structs: Dict[str, struct.Struct] = {}
+"""Compiled little endian structs, by format."""
+
+
+def _get_struct(fmt: str) -> struct.Struct:
+    compiled = _structs.get(fmt)
+    if compiled is None:
+        if len(_structs) > 1024:  # array formats include their length
+            _structs.clear()
+        compiled = _structs[fmt] = struct.Struct("<" + fmt)
+    return compiled
+
+
+_CHAR = _get_struct("c")
+_BOOL = _get_struct("?")
+_BYTE = _get_struct("b")
+_UBYTE = _get_struct("B")
+_SHORT = _get_struct("h")
+_USHORT = _get_struct("H")
+_INT = _get_struct("i")
+_UINT = _get_struct("I")
+_LONG = _get_struct("l")
+_ULONG = _get_struct("L")
+_LONGLONG = _get_struct("q")
+_ULONGLONG = _get_struct("Q")
+_FLOAT = _get_struct("f")
+_DOUBLE = _get_struct("d")
 
 
 class BinaryReader(_BaseBinaryWrapper):
     """
     Class used to read binary data.
+
+    When created from bytes or from an io.BytesIO, the reader keeps a memoryview over the data and its own
+    position, so that values are unpacked in place. Reading through the reader doesn't move the position of
+    the original io.BytesIO. Other streams are read through their methods, as are io.BytesIO subclasses with
+    a getvalue_is_cheap attribute set to False (such as lazily decompressed files).
     """
+    _zero_copy = True
+    """Whether the reader may read from a memoryview instead of the stream."""
+
+    def __init__(self, stream: Union[typing.BinaryIO, bytes] = b""):
+        self._view: Optional[memoryview] = None
+        """View over the data, if reading from memory."""
+        self._buffer: Optional[Union[bytes, bytearray]] = None
+        """The object under the view, if reading from memory."""
+        self._pos = 0
+        """Position of the reader, if reading from memory."""
+        if self._zero_copy and isinstance(stream, (bytes, bytearray, memoryview)):
+            # bytearrays are copied, like io.BytesIO does, so that they can still be resized
+            self._buffer = bytes(stream) if isinstance(stream, bytearray) else stream
+            self._view = memoryview(self._buffer).cast("B")
+            self.stream = None
+        elif self._zero_copy and isinstance(stream, BytesIO) and getattr(stream, "getvalue_is_cheap", True):
+            self._pos = stream.tell()
+            self._buffer = stream.getvalue()
+            self._view = memoryview(self._buffer)
+            self.stream = stream
+        else:
+            super().__init__(stream)
+
+    def _detach(self):
+        """
+        Stops reading from memory, continuing with the stream (or a new io.BytesIO) at the same position.
+        """
+        if self._view is not None:
+            if self.stream is None:
+                self.stream = BytesIO(self._view)
+            self.stream.seek(self._pos)
+            self._view.release()
+            self._view = self._buffer = None
+
+    # Wrappings, reading from memory when possible:
+    def close(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._view = self._buffer = None
+            self._pos = 0
+            self.stream = self.stream if self.stream is not None else BytesIO()
+        return self.stream.close()
+
+    def flush(self) -> None:
+        if self.stream is not None:
+            return self.stream.flush()
+
+    def read(self, n: int = -1) -> bytes:
+        if self._view is None:
+            return self.stream.read(n)
+        pos = self._pos
+        end = len(self._view) if n is None or n < 0 else min(pos + n, len(self._view))
+        if end <= pos:
+            return b""
+        self._pos = end
+        return self._view[pos:end].tobytes()
+
+    def readable(self) -> bool:
+        return True if self._view is not None else self.stream.readable()
+
+    def readline(self, limit: int = -1) -> AnyStr:
+        if self._view is None:
+            return self.stream.readline(limit)
+        end = self._find(b"\n", self._pos) + 1 or len(self._view)
+        if limit is not None and limit >= 0:
+            end = min(end, self._pos + limit)
+        return self.read(max(end - self._pos, 0))
+
+    def readlines(self, hint: int = -1) -> List[AnyStr]:
+        if self._view is None:
+            return self.stream.readlines(hint)
+        lines = []
+        total = 0
+        while line := self.readline():
+            lines.append(line)
+            total += len(line)
+            if hint is not None and 0 < hint <= total:
+                break
+        return lines
+
+    def write(self, s: Union[bytes, bytearray]) -> int:
+        self._detach()
+        return self.stream.write(s)
+
+    def writable(self) -> bool:
+        return True if self.stream is None else self.stream.writable()
+
+    def writelines(self, lines: Iterable[AnyStr]) -> None:
+        self._detach()
+        self.stream.writelines(lines)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if self._view is None:
+            return self.stream.seek(offset, whence)
+        # Same behaviour as io.BytesIO, relative seeks stop at the start
+        if whence == SEEK_SET:
+            if offset < 0:
+                raise ValueError(f"negative seek value {offset}")
+            pos = offset
+        elif whence == SEEK_CUR:
+            pos = max(self._pos + offset, 0)
+        elif whence == SEEK_END:
+            pos = max(len(self._view) + offset, 0)
+        else:
+            raise ValueError(f"invalid whence ({whence}, should be 0, 1 or 2)")
+        self._pos = pos
+        return pos
+
+    def seekable(self) -> bool:
+        return True if self._view is not None else self.stream.seekable()
+
+    def tell(self) -> int:
+        return self._pos if self._view is not None else self.stream.tell()
+
+    def fileno(self) -> int:
+        if self._view is not None and self.stream is None:
+            self._detach()
+        return self.stream.fileno()
+
+    def __enter__(self):
+        if self._view is None or self.stream is not None:
+            self.stream.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._view is None:
+            return self.stream.__exit__(exc_type, exc_val, exc_tb)
+        self.close()
+
+    def readall(self):
+        self.seek(0)
+        return self.read()
+
+    def getvalue(self):
+        if self._view is None:
+            return super().getvalue()
+        return self._buffer if isinstance(self._buffer, bytes) else self._view.tobytes()
+
+    def getbuffer(self) -> memoryview:
+        if self._view is None:
+            return super().getbuffer()
+        return memoryview(self._buffer).cast("B")
+
+    def __len__(self):
+        if self._view is None:
+            return super().__len__()
+        return len(self._view)
 
     # Read types
+    def _read_value(self, compiled: struct.Struct) -> Any:
+        view = self._view
+        if view is not None:
+            pos = self._pos
+            end = pos + compiled.size
+            if end > len(view):
+                self._pos = max(pos, len(view))
+                return None
+            self._pos = end
+            return compiled.unpack_from(view, pos)[0]
+        chunk = self.stream.read(compiled.size)
+        if len(chunk) != compiled.size:
+            return None
+        return compiled.unpack(chunk)[0]
+
     def read_struct(self, fmt) -> Optional[Tuple[Any]]:
-        chunksize = struct.calcsize("<" + fmt)
-        chunk = self.read(chunksize)
-        if len(chunk) != chunksize:
+        compiled = _get_struct(fmt)
+        view = self._view
+        if view is not None:
+            pos = self._pos
+            end = pos + compiled.size
+            if end > len(view):
+                if not compiled.size:
+                    return ()
+                self._pos = max(pos, len(view))
+                return None
+            self._pos = end
+            return compiled.unpack_from(view, pos)
+        chunk = self.stream.read(compiled.size)
+        if len(chunk) != compiled.size:
             return None
-        return struct.unpack("<" + fmt, chunk)
+        return compiled.unpack(chunk)
+
+    def read_array(self, dtype: "np.typing.DTypeLike", count: int = -1) -> Optional[np.ndarray]:
+        """
+        Reads an array of values at once.
+
+        Parameters
+        ----------
+        dtype : np.typing.DTypeLike
+            Type of the values, which may be a structured type. It's always read as little endian.
+        count : int
+            Number of values to read, or -1 to read values until the end of the data.
+
+        Returns
+        -------
+        Optional[np.ndarray]
+            The values, or None if there isn't enough data left. When reading from memory, the array is a
+            read-only view over the data instead of a copy.
+        """
+        dtype = np.dtype(dtype).newbyteorder("<")
+        if self._view is not None:
+            pos = self._pos
+            available = max(len(self._view) - pos, 0) // dtype.itemsize if dtype.itemsize else 0
+            if count < 0:
+                count = available
+            elif count > available:
+                self._pos = max(pos, len(self._view))
+                return None
+            self._pos = pos + count * dtype.itemsize
+            # The array refers to the buffer rather than to the view, so that the view can still be released
+            return np.frombuffer(self._buffer, dtype, count, pos)
+        if count < 0:
+            chunk = self.stream.read()
+            return np.frombuffer(chunk, dtype, len(chunk) // dtype.itemsize if dtype.itemsize else 0)
+        chunk = self.stream.read(count * dtype.itemsize)
+        if len(chunk) != count * dtype.itemsize:
+            return None
+        return np.frombuffer(chunk, dtype, count)
 
     def read_char(self) -> Optional[AnyStr]:
-        val = self.read_struct("c")
-        return val[0] if val else None
+        return self._read_value(_CHAR)
 
     def read_bool(self) -> Optional[bool]:
-        val = self.read_struct("?")
-        return val[0] if val else None
+        return self._read_value(_BOOL)
 
     def read_byte(self) -> Optional[int]:
-        val = self.read_struct("b")
-        return val[0] if val else None
+        return self._read_value(_BYTE)
 
     def read_ubyte(self) -> Optional[int]:
-        val = self.read_struct("B")
-        return val[0] if val else None
+        return self._read_value(_UBYTE)
 
     def read_short(self) -> Optional[int]:
-        val = self.read_struct("h")
-        return val[0] if val else None
+        return self._read_value(_SHORT)
 
     def read_ushort(self) -> Optional[int]:
-        val = self.read_struct("H")
-        return val[0] if val else None
+        return self._read_value(_USHORT)
 
     def read_int(self) -> Optional[int]:
-        val = self.read_struct("i")
-        return val[0] if val else None
+        return self._read_value(_INT)
 
     def read_uint(self) -> Optional[int]:
-        val = self.read_struct("I")
-        return val[0] if val else None
+        return self._read_value(_UINT)
 
     def read_long(self) -> Optional[int]:
-        val = self.read_struct("l")
-        return val[0] if val else None
+        return self._read_value(_LONG)
 
     def read_ulong(self) -> Optional[int]:
-        val = self.read_struct("L")
-        return val[0] if val else None
+        return self._read_value(_ULONG)
 
     def read_longlong(self) -> Optional[int]:
-        val = self.read_struct("q")
-        return val[0] if val else None
+        return self._read_value(_LONGLONG)
 
     def read_ulonglong(self) -> Optional[int]:
-        val = self.read_struct("Q")
-        return val[0] if val else None
+        return self._read_value(_ULONGLONG)
 
     def read_float(self) -> Optional[float]:
-        val = self.read_struct("f")
-        return val[0] if val else None
+        return self._read_value(_FLOAT)
 
     def read_double(self) -> Optional[float]:
-        val = self.read_struct("d")
-        return val[0] if val else None
+        return self._read_value(_DOUBLE)
 
     def read_string(self, size: Optional[int] = None, encoding: Optional[str] = "shift_jis", pad=b"\0"):
         if size:
@@ -171,29 +427,94 @@ class BinaryReader(_BaseBinaryWrapper):
                 return self.read(size).split(pad)[0].split(b"\0")[0].decode(encoding)
             else:
                 return self.read(size).split(pad)[0].split(b"\0")[0]
-        else:
-            ret = b""
-            while True:
-                c = self.read(1)
-                if c is None or c == pad:
-                    break
-                ret += c
-            if encoding:
-                return ret.decode(encoding)
+        if self._view is not None:
+            start = self._pos
+            end = self._find(pad, start)
+            if end < 0:
+                end = self._pos = max(len(self._view), start)
             else:
-                return ret
+                self._pos = end + len(pad)
+            string = self._view[start:end]
+        else:
+            string = self._read_until(pad)
+        if encoding:
+            return str(string, encoding)
+        return bytes(string)
+
+    def read_cstrings(self, offsets: Iterable[int], encoding: Optional[str] = "shift_jis",
+                      pad=b"\0") -> List[AnyStr]:
+        """
+        Reads the null terminated strings at each of the offsets, as with an offset table.
+
+        The position of the reader is left unchanged.
+
+        Parameters
+        ----------
+        offsets : Iterable[int]
+            Offsets of the strings, from the start of the data.
+        encoding : Optional[str]
+            Encoding of the strings, or None to return them as bytes.
+        pad : bytes
+            Terminator of the strings.
+
+        Returns
+        -------
+        List[AnyStr]
+            The string at each offset.
+        """
+        pos = self.tell()
+        strings = []
+        for offset in offsets:
+            self.seek(offset)
+            strings.append(self.read_string(encoding=encoding, pad=pad))
+        self.seek(pos)
+        return strings
+
+    def _find(self, sub: bytes, start: int) -> int:
+        """
+        Finds sub in the data from start as bytes.find does, when reading from memory.
+        """
+        if isinstance(self._buffer, bytes):
+            return self._buffer.find(sub, start)
+        # memoryviews can't be searched, so search copies of growing chunks
+        chunk_size = 0x100
+        while start < len(self._view):
+            chunk = self._view[start:start + chunk_size].tobytes()
+            if (found := chunk.find(sub)) >= 0:
+                return start + found
+            if start + chunk_size >= len(self._view):
+                break
+            start += chunk_size - len(sub) + 1
+            chunk_size *= 2
+        return -1
+
+    def _read_until(self, terminator: bytes) -> bytes:
+        """
+        Reads from the stream until the terminator, which is skipped, or until the end.
+        """
+        start = self.stream.tell()
+        data = b""
+        searched = 0
+        while (found := data.find(terminator, searched)) < 0:
+            chunk = self.stream.read(max(len(data), 0x100))  # doubling, so that reading stays linear
+            if not chunk:
+                return data
+            searched = max(len(data) - len(terminator) + 1, 0)
+            data += chunk
+        self.stream.seek(start + found + len(terminator))
+        return data[:found]
 
     def read_int24(self) -> Optional[int]:  # Little endian only
         chunk = self.read(3)
         if len(chunk) != 3:
             return None
-        return struct.unpack('<i', chunk + (b'\0' if chunk[2] < 128 else b'\xff'))[0]
+        return int.from_bytes(chunk, "little", signed=True)
 
     def read_uint24(self) -> Optional[int]:  # Little endian only
         chunk = self.read(3)
         if len(chunk) != 3:
             return None
-        return struct.unpack('<I', chunk + b"\0")[0]
+        return int.from_bytes(chunk, "little")
 
     #  Arrays
     def read_struct_array(self, n: int, fmt):
@@ -251,29 +572,14 @@ class BinaryReader(_BaseBinaryWrapper):
         return [self.read_uint24() for _ in range(n)]
 
     # Aliasses
-    def read_int8(self) -> Optional[int]:
-        return self.read_byte()
-
-    def read_int16(self) -> Optional[int]:
-        return self.read_short()
-
-    def read_int32(self) -> Optional[int]:
-        return self.read_int()
-
-    def read_int64(self) -> Optional[int]:
-        return self.read_longlong()
-
-    def read_uint8(self) -> Optional[int]:
-        return self.read_ubyte()
-
-    def read_uint16(self) -> Optional[int]:
-        return self.read_ushort()
-
-    def read_uint32(self) -> Optional[int]:
-        return self.read_uint()
-
-    def read_uint64(self) -> Optional[int]:
-        return self.read_ulonglong()
+    read_int8 = read_byte
+    read_int16 = read_short
+    read_int32 = read_int
+    read_int64 = read_longlong
+    read_uint8 = read_ubyte
+    read_uint16 = read_ushort
+    read_uint32 = read_uint
+    read_uint64 = read_ulonglong
 
     def read_int8_array(self, n: int) -> Optional[List[int]]:
         return self.read_byte_array(n)
@@ -307,7 +613,19 @@ class BinaryWriter(_BaseBinaryWrapper):
     # Write types
 
     def write_struct(self, fmt: AnyStr, *values):
-        self.write(struct.pack("<" + fmt, *values))
+        self.write(_get_struct(fmt).pack(*values))
+
+    def write_array(self, array: np.ndarray):
+        """
+        Writes all the values of an array at once, in little endian.
+
+        Parameters
+        ----------
+        array : np.ndarray
+            The array to write, which may have a structured type.
+        """
+        array = np.ascontiguousarray(array, array.dtype.newbyteorder("<"))
+        self.write(memoryview(array.reshape(-1).view(np.uint8)))
 
     def write_char(self, x: AnyStr):
         self.write_struct("c", x)
@@ -486,4 +804,4 @@ class BinaryEditor(BinaryReader, BinaryWriter):
     """
     Class used for both reading and writing binary data.
     """
-    pass
+    _zero_copy = False
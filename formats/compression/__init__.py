@@ -1,9 +1,20 @@
 import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import *
-import ndspy.lz10 as lz10
+import ndspy.lz10
+from formats import conf
 from formats.compression import rle, huffman
+from formats.compression.cache import CompressionCache
 import struct
 
+try:
+    from formats.compression import lz10
+except ImportError:  # native extension not built, use ndspy's codec
+    logging.info("Native LZ10 codec not available, using ndspy")
+    lz10 = None
+
 # Compression containers
 LZ10 = 0x10
 RLE = 0x30
@@ -17,6 +28,76 @@ SECOND_TYPES = {
     HUFF8BIT: 4
 }
 
+BEST = "best"
+"""
+Compresses with every container the game can load for the file, keeping the smallest result.
+
+Double typed files can use any of the SECOND_TYPES, while other files are always LZ10.
+"""
+
+DECOMPRESS_CHUNK_SIZE = 0x10000
+"""Default size of the chunks yielded by decompress_chunks."""
+
+
+_compression_cache: Optional[CompressionCache] = None
+
+
+def get_compression_cache() -> Optional[CompressionCache]:
+    """
+    Gets the compression cache configured in conf.COMPRESSION_CACHE_PATH.
+
+    Returns
+    -------
+    CompressionCache | None
+        The cache, or None if the cache is disabled.
+    """
+    global _compression_cache
+    if conf.COMPRESSION_CACHE_PATH is None:
+        return None
+    if _compression_cache is None or _compression_cache.path != conf.COMPRESSION_CACHE_PATH:
+        _compression_cache = CompressionCache(conf.COMPRESSION_CACHE_PATH, conf.COMPRESSION_CACHE_SIZE)
+    _compression_cache.max_size = conf.COMPRESSION_CACHE_SIZE
+    return _compression_cache
+
+
+@dataclass
+class BestCompressionReport:
+    """
+    Dataclass accumulating the results of compressing with the BEST compression type.
+    """
+    payloads: int = 0
+    """Number of payloads compressed."""
+    bytes_saved: int = 0
+    """Total size saved compared to compressing with LZ10."""
+    chosen_types: Dict[int, int] = field(default_factory=dict)
+    """Number of payloads for which each compression type was chosen."""
+
+    def __str__(self):
+        chosen = ", ".join(f"{hex(compression_type)}: {count}"
+                           for compression_type, count in self.chosen_types.items())
+        return f"{self.bytes_saved} bytes saved over LZ10 in {self.payloads} files ({chosen})"
+
+
+best_compression_report = BestCompressionReport()
+"""Results of the BEST compressions since the report was last taken with take_best_compression_report."""
+
+
+def take_best_compression_report() -> BestCompressionReport:
+    """
+    Gets the results of the BEST compressions since the last call, and starts a new report.
+    """
+    global best_compression_report
+    report, best_compression_report = best_compression_report, BestCompressionReport()
+    return report
+
+
+def compression_type_of(data: bytes, double_typed: bool) -> Optional[int]:
+    """
+    Gets the compression type of compressed data, or None if the data is empty.
+    """
+    offset = 4 if double_typed else 0
+    return data[offset] if len(data) > offset else None
+
 
 def compress(data: bytes, compression_type=LZ10, double_typed: bool = None) -> bytes:
     if not data:
@@ -24,9 +105,40 @@ def compress(data: bytes, compression_type=LZ10, double_typed: bool = None) -> b
     if double_typed is None:
         logging.warning("Compressing file without knowing if it's double typed, defaulting to not.")
         double_typed = False
+    if compression_type == BEST:
+        # Trial the containers in threads, as starting processes costs more than compressing a single file
+        return _compress_payloads([data], [BEST], [double_typed], ThreadPoolExecutor, len(SECOND_TYPES))[0]
+    cache = get_compression_cache()
+    if cache is None:
+        return _compress(data, compression_type, double_typed)
+    key = _cache_key(cache, data, compression_type, double_typed)
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = _compress(data, compression_type, double_typed)
+        cache.put(key, compressed)
+    return compressed
+
+
+def _cache_key(cache: CompressionCache, data: bytes, compression_type: int, double_typed: bool) -> str:
+    """
+    Gets the cache key of the data, which for LZ10 depends on the codec used and on its compression level.
+    """
+    codec = ""
+    if compression_type == LZ10:
+        codec = "ndspy" if lz10 is None else f"native{conf.LZ10_COMPRESSION_LEVEL}"
+    return cache.key(data, compression_type, double_typed, codec)
+
+
+def _compress(data: bytes, compression_type: int, double_typed: bool, lz10_level: int = None) -> bytes:
+    if not data:
+        return b""
     other_type = struct.pack("<I", SECOND_TYPES[compression_type]) if double_typed else b""
     if compression_type == LZ10:
-        return other_type + lz10.compress(data)
+        if lz10 is None:
+            return other_type + ndspy.lz10.compress(data)
+        if lz10_level is None:
+            lz10_level = conf.LZ10_COMPRESSION_LEVEL
+        return other_type + lz10.compress(data, lz10_level)
     elif compression_type == RLE:
         return other_type + rle.compress(data)
     elif compression_type == HUFF8BIT:
@@ -37,6 +149,150 @@ def compress(data: bytes, compression_type=LZ10, double_typed: bool = None) -> b
         raise NotImplementedError(f"compression type: {hex(compression_type)}")
 
 
+def compress_many(payloads: List[bytes], compression_types: Union[int, str, List[Union[int, str]]] = LZ10,
+                  double_typed: Union[bool, List[bool]] = False, workers: Optional[int] = None) -> List[bytes]:
+    """
+    Compresses several payloads in parallel using a process pool.
+
+    Parameters
+    ----------
+    payloads : List[bytes]
+        The data to compress.
+    compression_types : int | str | List[int | str]
+        The compression type for all payloads, or a list with the compression type of each payload. With BEST,
+        each container is compressed as a separate job.
+    double_typed : bool | List[bool]
+        Whether all payloads are double typed, or a list with the value for each payload.
+    workers : int
+        Maximum number of processes to use. Defaults to conf.COMPRESSION_WORKERS.
+
+    Returns
+    -------
+    List[bytes]
+        The compressed payloads, in the same order as the input. The output is identical to calling
+        compress on each payload.
+    """
+    if not isinstance(compression_types, list):
+        compression_types = [compression_types] * len(payloads)
+    if not isinstance(double_typed, list):
+        double_typed = [double_typed] * len(payloads)
+    if workers is None:
+        workers = conf.COMPRESSION_WORKERS or os.cpu_count() or 1
+    return _compress_payloads(payloads, compression_types, double_typed, ProcessPoolExecutor, workers)
+
+
+def _candidate_types(compression_type: Union[int, str], double_typed: bool) -> List[int]:
+    """
+    Gets the containers to try for a compression type.
+    """
+    if compression_type != BEST:
+        return [compression_type]
+    if not double_typed:
+        return [LZ10]
+    return [LZ10] + [other_type for other_type in SECOND_TYPES if other_type != LZ10]
+
+
+def _compress_payloads(payloads: List[bytes], compression_types: List[Union[int, str]], double_typed: List[bool],
+                       executor_type: Type[Executor], workers: int) -> List[bytes]:
+    # One job for each payload and container to try
+    jobs = [(i, compression_type) for i in range(len(payloads))
+            for compression_type in _candidate_types(compression_types[i], double_typed[i])]
+    results: Dict[Tuple[int, int], bytes] = {}
+    keys: Dict[Tuple[int, int], str] = {}
+    cache = get_compression_cache()
+    if cache is not None:
+        for job in jobs:
+            i, compression_type = job
+            if payloads[i]:
+                keys[job] = _cache_key(cache, payloads[i], compression_type, double_typed[i])
+                compressed = cache.get(keys[job])
+                if compressed is not None:
+                    results[job] = compressed
+
+    # Only compress the jobs missing from the cache
+    missing = [job for job in jobs if job not in results]
+    workers = min(workers, len(missing))
+    if workers <= 1:
+        compressed = [_compress(payloads[i], compression_type, double_typed[i]) for i, compression_type in missing]
+    else:
+        with executor_type(workers) as executor:
+            # The level is passed explicitly, as the workers may not share the configuration of this process
+            compressed = list(executor.map(_compress, [payloads[i] for i, _ in missing],
+                                           [compression_type for _, compression_type in missing],
+                                           [double_typed[i] for i, _ in missing],
+                                           [conf.LZ10_COMPRESSION_LEVEL] * len(missing)))
+    for job, data in zip(missing, compressed):
+        results[job] = data
+        if job in keys:
+            cache.put(keys[job], data)
+
+    output = []
+    for i in range(len(payloads)):
+        if compression_types[i] != BEST:
+            output.append(results[(i, compression_types[i])])
+            continue
+        # Keep the smallest result, preferring LZ10 when tied. Huffman trees with many symbols can overflow the
+        # offsets of their nodes, so Huffman results are checked before being kept.
+        candidates = sorted(_candidate_types(BEST, double_typed[i]),
+                            key=lambda compression_type: len(results[(i, compression_type)]))
+        for best_type in candidates:
+            if best_type not in (HUFF4BIT, HUFF8BIT) or \
+                    decompress(results[(i, best_type)], double_typed[i])[0] == payloads[i]:
+                break
+        output.append(results[(i, best_type)])
+        if payloads[i]:
+            report = best_compression_report
+            report.payloads += 1
+            report.bytes_saved += len(results[(i, LZ10)]) - len(output[-1])
+            report.chosen_types[best_type] = report.chosen_types.get(best_type, 0) + 1
+    return output
+
+
+def _split_chunks(data: bytes, chunk_size: int) -> Iterator[bytes]:
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def decompress_chunks(data: bytes, double_typed: bool = None,
+                      chunk_size: int = DECOMPRESS_CHUNK_SIZE) -> Tuple[Iterator[bytes], bool]:
+    """
+    Decompresses data incrementally, so that the start of the data can be used before the rest is decompressed.
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed data.
+    double_typed : bool
+        Whether the data has its compression type specified twice. Detected if not specified.
+    chunk_size : int
+        Approximate size of each chunk.
+
+    Returns
+    -------
+    Tuple[Iterator[bytes], bool]
+        An iterator over consecutive chunks of the decompressed data, which are decompressed as they are
+        requested, and whether the data is double typed.
+    """
+    if not data:
+        return iter(()), double_typed
+    if double_typed is None:
+        first_word = struct.unpack("<I", data[:4])
+        double_typed = first_word in SECOND_TYPES.values()
+    if double_typed:
+        data = data[4:]
+    compression_type = data[0]
+    if compression_type == LZ10:
+        if lz10 is None:
+            return _split_chunks(ndspy.lz10.decompress(data), chunk_size), double_typed
+        return lz10.decompress_chunks(data, chunk_size), double_typed
+    elif compression_type == RLE:
+        return rle.decompress_chunks(data, chunk_size), double_typed
+    elif compression_type in [HUFF8BIT, HUFF4BIT]:
+        return huffman.decompress_chunks(data, chunk_size), double_typed
+    else:
+        raise NotImplementedError(f"compression type: {hex(compression_type)}")
+
+
 def decompress(data: bytes, double_typed: bool = None) -> Tuple[bytes, bool]:
     if not data:
         return b"", double_typed
@@ -47,8 +303,9 @@ def decompress(data: bytes, double_typed: bool = None) -> Tuple[bytes, bool]:
         data = data[4:]
     compression_type = data[0]
     if compression_type == LZ10:
-        ret = lz10.decompress(data), double_typed
-        return ret
+        if lz10 is None:
+            return ndspy.lz10.decompress(data), double_typed
+        return lz10.decompress(data), double_typed
     elif compression_type == RLE:
         return rle.decompress(data), double_typed
     elif compression_type in [HUFF8BIT, HUFF4BIT]:
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import *
+
+
+class CompressionCache:
+    """
+    On-disk cache of compressed data, keyed by the codec, its settings and the SHA-256 of the uncompressed data.
+
+    Entries are evicted in least recently used order when the total size of the cache exceeds max_size.
+    """
+    def __init__(self, path: str, max_size: int):
+        """
+        Parameters
+        ----------
+        path : str
+            Directory in which the cache entries are stored.
+        max_size : int
+            Maximum size in bytes of all the entries together.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        """Number of lookups which found an entry."""
+        self.misses = 0
+        """Number of lookups which didn't find an entry."""
+
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        """Size of each entry, ordered from least to most recently used."""
+        self.size = 0
+        """Total size of the entries in bytes."""
+
+        os.makedirs(self.path, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self.size += size
+
+    @staticmethod
+    def key(data: bytes, compression_type: int, double_typed: bool, codec: str = "") -> str:
+        """
+        Gets the key of the entry for the specified uncompressed data and codec.
+
+        Parameters
+        ----------
+        data : bytes
+            The uncompressed data.
+        compression_type : int
+            The compression container.
+        double_typed : bool
+            Whether the data is double typed.
+        codec : str
+            Identifies the implementation and settings the data is compressed with, when they change the output.
+        """
+        return f"{compression_type:02x}{int(double_typed)}{codec}_{hashlib.sha256(data).hexdigest()}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Gets the compressed data stored for the key, or None if it isn't cached.
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        entry_path = os.path.join(self.path, key)
+        try:
+            with open(entry_path, "rb") as f:
+                data = f.read()
+            os.utime(entry_path)  # keep the LRU order between sessions
+        except OSError:
+            self.size -= self._entries.pop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """
+        Stores the compressed data for the key, evicting the least recently used entries if needed.
+        """
+        if len(data) > self.max_size:
+            return
+        entry_path = os.path.join(self.path, key)
+        try:
+            with open(entry_path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(entry_path + ".tmp", entry_path)
+        except OSError as e:
+            logging.warning(f"Could not write compression cache entry: {e}")
+            return
+        if key in self._entries:
+            self.size -= self._entries.pop(key)
+        self._entries[key] = len(data)
+        self.size += len(data)
+
+        while self.size > self.max_size:
+            evicted_key, evicted_size = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            try:
+                os.remove(os.path.join(self.path, evicted_key))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
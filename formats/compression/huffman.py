@@ -1,84 +1,162 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
 from formats.binary import BinaryReader, BinaryWriter
 from typing import *
+import numpy as np
+
+DECODE_TABLE_BITS = 12
+"""Maximum number of bits decoded at once with the lookup table."""
+
+
+class HuffTree:
+    """
+    Huffman tree stored as flat arrays, indexed by node.
 
+    Leaves are created first, so the leaf of each symbol has a lower index than any internal node.
+    """
+    def __init__(self):
+        self.is_data: List[bool] = []
+        self.data: List[int] = []
+        self.child0: List[int] = []
+        self.child1: List[int] = []
 
-class HuffTreeNode:
-    def __init__(self, is_data: bool, data: Optional[int] = None, parent=None, child0=None, child1=None):
-        self.is_data: bool = is_data
-        self.data: Optional[int] = data
-        self.parent: Optional[HuffTreeNode] = parent
-        self.child0: Optional[HuffTreeNode] = child0
-        self.child1: Optional[HuffTreeNode] = child1
-        if self.child0:
-            self.child0.parent = self
-        if self.child1:
-            self.child1.parent = self
+    def add_node(self, is_data: bool, data: int = 0, child0: int = -1, child1: int = -1) -> int:
+        self.is_data.append(is_data)
+        self.data.append(data)
+        self.child0.append(child0)
+        self.child1.append(child1)
+        return len(self.is_data) - 1
+
+    def __len__(self):
+        return len(self.is_data)
 
     @classmethod
-    def from_rdr(cls, rdr: BinaryReader, is_data: bool, relative_offset, max_stream_pos, parent=None):
-        self = cls(is_data, parent=parent)
-        if rdr.c >= max_stream_pos:
-            return
-        self.data = rdr.read_uint8()
-        if not is_data:
-            offset = self.data & 0x3F
-            zero_is_data = (self.data & 0x80) > 0
-            one_is_data = (self.data & 0x40) > 0
-
-            # off AND NOT == off XOR (off AND 1)
-            zero_rel_offset = (relative_offset ^ (relative_offset & 1)) + offset * 2 + 2
-
-            curr_stream_pos = rdr.c
-
-            rdr.c += (zero_rel_offset - relative_offset) - 1
-
-            # Node after 0
-            self.child0 = HuffTreeNode.from_rdr(
-                rdr, zero_is_data, zero_rel_offset, max_stream_pos, parent=self)
-            # Node after 1 directly located after the node after 0
-            self.child1 = HuffTreeNode.from_rdr(
-                rdr, one_is_data, zero_rel_offset + 1, max_stream_pos, parent=self)
-
-            # reset stream
-            rdr.c = curr_stream_pos
-        return self
-
-    def to_wtr(self, wtr: BinaryWriter):
-        queue: List[HuffTreeNode] = [self]
-        while len(queue):
-            node: HuffTreeNode = queue[0]
-            queue = queue[1:]
-            if node.is_data:
-                wtr.write_ubyte(node.data)
+    def build(cls, frequencies: List[int]):
+        """
+        Builds the tree for the symbol frequencies.
+
+        Parameters
+        ----------
+        frequencies : List[int]
+            Number of appearances of each symbol.
+
+        Returns
+        -------
+        Tuple[HuffTree, int, List[int]]
+            The tree, the index of its root, and the index of the leaf of each symbol (-1 if not present).
+        """
+        self = cls()
+        leaves = [-1] * len(frequencies)
+        leaf_queue = []
+        for i in range(len(frequencies)):
+            if frequencies[i] == 0:
+                continue
+            leaves[i] = self.add_node(True, data=i)
+            leaf_queue.append((frequencies[i], leaves[i]))
+
+        if len(leaf_queue) < 2:  # Add an unused node to make it possible
+            leaves[0] = self.add_node(True, data=0)
+            leaf_queue.append((1, leaves[0]))
+
+        # The lowest priority is taken first, with leaves taken in order of creation when tied, and with
+        # internal nodes preferred to leaves of the same priority. The leaves are popped from the end.
+        leaf_queue.sort(key=lambda x: x[0])
+        leaf_queue.reverse()
+        node_queue = []
+        node_order = 0
+
+        def take_lowest() -> Tuple[int, int]:
+            if leaf_queue and (not node_queue or leaf_queue[-1][0] < node_queue[0][0]):
+                return leaf_queue.pop()
+            prio, _, node = heapq.heappop(node_queue)
+            return prio, node
+
+        while len(leaf_queue) + len(node_queue) > 1:
+            one_prio, one = take_lowest()
+            two_prio, two = take_lowest()
+            new_node = self.add_node(False, child0=one, child1=two)
+            heapq.heappush(node_queue, (one_prio + two_prio, node_order, new_node))
+            node_order += 1
+
+        return self, node_queue[0][2], leaves
+
+    def codes(self, root: int) -> Tuple[List[int], List[int]]:
+        """
+        Gets the code of every node, as its path from the root with 1 meaning child1.
+
+        Returns
+        -------
+        Tuple[List[int], List[int]]
+            The code and the code length of each node.
+        """
+        codes = [0] * len(self)
+        lengths = [0] * len(self)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if self.is_data[node]:
+                continue
+            for bit, child in enumerate((self.child0[node], self.child1[node])):
+                codes[child] = (codes[node] << 1) | bit
+                lengths[child] = lengths[node] + 1
+                stack.append(child)
+        return codes, lengths
+
+    def to_wtr(self, root: int, wtr: BinaryWriter):
+        queue = [root]
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+            if self.is_data[node]:
+                wtr.write_ubyte(self.data[node])
             else:
-                data = (len(queue) // 2) & 0x3f
-                if node.child0.is_data:
+                data = ((len(queue) - i) // 2) & 0x3f
+                if self.is_data[self.child0[node]]:
                     data |= 0x80
-                if node.child1.is_data:
+                if self.is_data[self.child1[node]]:
                     data |= 0x40
                 wtr.write_ubyte(data)
-                queue.append(node.child0)
-                queue.append(node.child1)
-
-    @property
-    def depth(self):
-        if self.parent:
-            return self.parent.depth + 1
-        return 0
-
-    @property
-    def is_child1(self) -> bool:
-        return self.parent.child1 == self
+                queue.append(self.child0[node])
+                queue.append(self.child1[node])
 
-    @property
-    def is_filled(self):
-        return self.data is None
+    @classmethod
+    def from_bytes(cls, tree: bytes):
+        """
+        Reads a serialized tree, where tree[0] is the tree size byte and tree[1] the root.
+
+        Returns
+        -------
+        Tuple[HuffTree, int]
+            The tree and the index of its root.
+        """
+        self = cls()
+        root = self.add_node(False, tree[1])
+        stack = [(root, 1)]
+        while stack:
+            node, pos = stack.pop()
+            offset = tree[pos] & 0x3F
+            child_pos = (pos & ~1) + offset * 2 + 2
+            for bit, flag in enumerate((0x80, 0x40)):
+                is_data = (tree[pos] & flag) > 0
+                child = self.add_node(is_data, tree[child_pos + bit])
+                if bit:
+                    self.child1[node] = child
+                else:
+                    self.child0[node] = child
+                if not is_data:
+                    stack.append((child, child_pos + bit))
+        return self, root
 
 
 def compress(input_data: bytes, datablock_size=None) -> bytes:
     if datablock_size is None:
-        # Return the smallest we can
-        return min(compress(input_data, 4), compress(input_data, 8), key=lambda x: len(x))
+        # Return the smallest we can, trying both block sizes at the same time
+        with ThreadPoolExecutor(1) as executor:
+            compressed4 = executor.submit(compress, input_data, 4)
+            compressed8 = compress(input_data, 8)
+            return min(compressed4.result(), compressed8, key=lambda x: len(x))
 
     assert datablock_size in [4, 8]
 
@@ -90,106 +168,65 @@ def compress(input_data: bytes, datablock_size=None) -> bytes:
     if len(input_data) > 0xffffff:
         wtr.write_uint32(len(input_data))
 
-    # build frequency table
-    frequencies = [0 for _ in range(0x100 if datablock_size == 8 else 0x10)]
-    for b in input_data:
-        if datablock_size == 8:
-            frequencies[b] += 1
-        else:
-            b0, b1 = b & 0xf, b >> 4
-            frequencies[b0] += 1
-            frequencies[b1] += 1
-
-    # build the huffman tree
-    node_count = 0
-    leaf_queue = []
-    node_queue = []
-    leaves: List[Optional[HuffTreeNode]] = [None for _ in range(0x100 if datablock_size == 8 else 0x10)]
-    for i in range(0x10 if datablock_size == 4 else 0x100):
-        if frequencies[i] == 0:
-            continue
-        node = HuffTreeNode(True, data=i)
-        leaves[i] = node
-        leaf_queue.append((frequencies[i], node))
-        node_count += 1
-
-    if len(leaf_queue) < 2:  # Add an unused node to make it possible
-        node = HuffTreeNode(True, data=0)
-        leaves[0] = node
-        leaf_queue.append((1, node))
-        node_count += 1
-
-    def take_lowest(queue0: List[Tuple[int, HuffTreeNode]],
-                    queue1: List[Tuple[int, HuffTreeNode]]) -> Tuple[int, HuffTreeNode]:
-        if queue0:
-            lowest_queue0 = min(queue0, key=lambda x: x[0])
-        elif queue1:
-            lowest_queue1 = min(queue1, key=lambda x: x[0])
-            queue1.remove(lowest_queue1)
-            return lowest_queue1
-        else:
-            raise ValueError("take_lowest() arg are empty sequences")
-        if queue1:
-            lowest_queue1 = min(queue1, key=lambda x: x[0])
-        else:
-            queue0.remove(lowest_queue0)
-            return lowest_queue0
-        if lowest_queue0[0] < lowest_queue1[0]:
-            queue0.remove(lowest_queue0)
-            return lowest_queue0
-        else:
-            queue1.remove(lowest_queue1)
-            return lowest_queue1
-
-    while len(leaf_queue) + len(node_queue) > 1:
-        one_prio, one = take_lowest(leaf_queue, node_queue)
-        two_prio, two = take_lowest(leaf_queue, node_queue)
-
-        newnode = HuffTreeNode(False, child0=one, child1=two)
-        node_queue.append((one_prio + two_prio, newnode))
-        node_count += 1
+    symbols = np.frombuffer(input_data, np.uint8)
+    if datablock_size == 4:
+        # Low nibble first
+        symbols = np.stack([symbols & 0xf, symbols >> 4], axis=1).reshape(-1)
+    frequencies = np.bincount(symbols, minlength=1 << datablock_size).tolist()
 
-    root: HuffTreeNode = node_queue[0][1]
+    tree, root, leaves = HuffTree.build(frequencies)
 
     # write the huffman tree
-    wtr.write_uint8((node_count - 1) // 2)
-    root.to_wtr(wtr)
-
-    datablock = 0
-    bits_left = 32
-    cached_byte = 0
-    for i in range(len(input_data) * (2 if datablock_size == 4 else 1)):
-        if datablock_size == 4:
-            if i & 1 == 0:
-                cached_byte = input_data[i // 2]
-                data = cached_byte & 0xf
-            else:
-                data = cached_byte >> 4
-        else:
-            data = input_data[i]
-
-        node = leaves[data]
-        depth = node.depth
-        path: List[bool] = [False for _ in range(depth)]
-        for d in range(depth):
-            path[depth - d - 1] = node.is_child1
-            node = node.parent
-        for p in path:
-            if bits_left == 0:
-                wtr.write_uint32(datablock)
-                datablock = 0
-                bits_left = 32
-            bits_left -= 1
-            if p:
-                datablock |= 1 << bits_left
-    if bits_left != 32:
-        wtr.write_uint32(datablock)
+    wtr.write_uint8((len(tree) - 1) // 2)
+    tree.to_wtr(root, wtr)
+
+    # Table of the code of each symbol, as bits (most significant first) and length
+    codes, lengths = tree.codes(root)
+    code_lengths = np.zeros(len(frequencies), np.int64)
+    for symbol, leaf in enumerate(leaves):
+        if leaf >= 0:
+            code_lengths[symbol] = lengths[leaf]
+    max_length = int(code_lengths.max())
+    code_bits = np.zeros((len(frequencies), max_length), np.uint8)
+    for symbol, leaf in enumerate(leaves):
+        for k in range(lengths[leaf] if leaf >= 0 else 0):
+            code_bits[symbol, k] = (codes[leaf] >> (lengths[leaf] - k - 1)) & 1
+
+    # Lay out the codes of all the symbols one after the other, padded to 32 bit words, which are
+    # written in little endian with their most significant bit first.
+    symbol_lengths = code_lengths[symbols]
+    ends = np.cumsum(symbol_lengths)
+    starts = ends - symbol_lengths
+    total_bits = int(ends[-1]) if len(ends) else 0
+    bits = np.zeros((total_bits + 31) // 32 * 32, np.uint8)
+    for k in range(max_length):
+        in_code = symbol_lengths > k
+        bits[starts[in_code] + k] = code_bits[symbols[in_code], k]
+    wtr.write_array(np.packbits(bits).view(">u4"))
     return wtr.getvalue()
 
 
 def decompress(data: bytes) -> bytes:
+    return b"".join(decompress_chunks(data))
+
+
+def decompress_chunks(data: bytes, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Decompresses Huffman compressed data incrementally.
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed data, with the Huffman header.
+    chunk_size : int
+        Size of each chunk. By default the data is decompressed in a single chunk.
+
+    Yields
+    ------
+    bytes
+        Consecutive chunks of the decompressed data.
+    """
     rdr = BinaryReader(data)
-    wtr = BinaryWriter()
     compression_type = rdr.read_uint8()
     if compression_type == 0x24:
         blocksize = 4
@@ -199,47 +236,67 @@ def decompress(data: bytes) -> bytes:
         raise Exception("Tried to decompress something as huffman that isn't huffman")
     ds = rdr.read_uint24()
     if ds == 0:
-        rdr.read_uint32()
+        ds = rdr.read_uint32()
 
     # Read the tree
     treesize = (rdr.read_uint8() + 1) * 2
-    tree_end = (rdr.c - 1) + treesize
-    root_node = HuffTreeNode.from_rdr(rdr, False, 5, tree_end)
-    rdr.c = tree_end
-
-    # Decompress with the tree
-    bitsleft = 0  # amount of bits left to read from {commands}
-    current_size = 0
-    current_node = root_node
-
-    cashedbyte = -1
-
-    while current_size < ds:
-        # Find next reference to commands node
-        while not current_node.is_data:
-            if bitsleft == 0:
-                data = rdr.read_uint32()
-                bitsleft = 32
-
-            bitsleft -= 1
-            next_is_one = (data & (1 << bitsleft)) != 0
-            if next_is_one:
-                current_node = current_node.child1
-            else:
-                current_node = current_node.child0
-
-        if blocksize == 8:
-            current_size += 1
-            wtr.write_uint8(current_node.data)
-
-        elif blocksize == 4:
-            if cashedbyte < 0:
-                cashedbyte = current_node.data
-            else:
-                cashedbyte |= current_node.data << 4
-                wtr.write_uint8(cashedbyte)
-                current_size += 1
-                cashedbyte = -1
-        current_node = root_node
-
-    return wtr.data
+    tree_start = rdr.c - 1
+    tree, root = HuffTree.from_bytes(data[tree_start:tree_start + treesize])
+    rdr.c = tree_start + treesize
+
+    # Build the lookup table, which decodes the next table_bits bits at once. Entries with a length of 0
+    # correspond to longer codes, and hold the node reached after table_bits bits instead of a symbol.
+    codes, lengths = tree.codes(root)
+    table_bits = min(max(lengths), DECODE_TABLE_BITS)
+    table_data = [0] * (1 << table_bits)
+    table_length = [0] * (1 << table_bits)
+    for node in range(len(tree)):
+        if tree.is_data[node] and lengths[node] <= table_bits:
+            start = codes[node] << (table_bits - lengths[node])
+            end = start + (1 << (table_bits - lengths[node]))
+            table_data[start:end] = [tree.data[node]] * (end - start)
+            table_length[start:end] = [lengths[node]] * (end - start)
+        elif not tree.is_data[node] and lengths[node] == table_bits:
+            table_data[codes[node]] = node
+    child0, child1, is_data, node_data = tree.child0, tree.child1, tree.is_data, tree.data
+
+    # Decompress with the table
+    words = np.frombuffer(data, "<u4", count=(len(data) - rdr.c) // 4, offset=rdr.c).tolist()
+    word_i = 0
+    table_mask = (1 << table_bits) - 1
+    bits = 0  # buffered bits, the oldest being the most significant
+    bitsleft = 0  # amount of bits buffered
+    symbols_per_byte = 2 if blocksize == 4 else 1
+    if not chunk_size:
+        chunk_size = ds
+    for chunk_start in range(0, ds, chunk_size):
+        out = bytearray(min(chunk_size, ds - chunk_start) * symbols_per_byte)
+        for i in range(len(out)):
+            if bitsleft < table_bits:
+                bits = ((bits & ((1 << bitsleft) - 1)) << 32) | (words[word_i] if word_i < len(words) else 0)
+                word_i += 1
+                bitsleft += 32
+            index = (bits >> (bitsleft - table_bits)) & table_mask
+            length = table_length[index]
+            if length:
+                out[i] = table_data[index]
+                bitsleft -= length
+                continue
+
+            # Long code, continue one bit at a time
+            bitsleft -= table_bits
+            node = table_data[index]
+            while not is_data[node]:
+                if bitsleft == 0:
+                    bits = words[word_i] if word_i < len(words) else 0
+                    word_i += 1
+                    bitsleft = 32
+                bitsleft -= 1
+                node = child1[node] if (bits >> bitsleft) & 1 else child0[node]
+            out[i] = node_data[node]
+
+        if blocksize == 4:
+            nibbles = np.frombuffer(out, np.uint8)
+            yield (nibbles[0::2] | (nibbles[1::2] << 4)).tobytes()
+        else:
+            yield bytes(out)
@@ -0,0 +1,303 @@
+import cython
+from libc.stdlib cimport malloc, free
+from libc.string cimport memset
+
+# Compression levels
+FAST = 0
+"""Greedy parsing, taking the longest match found in a short search of the hash chain."""
+OPTIMAL = 1
+"""Optimal parsing over the longest match at every position, searching the whole window."""
+
+cdef enum:
+    MIN_MATCH = 3
+    MAX_MATCH = 18
+    MIN_DISTANCE = 2  # Distance 1 is not safe for 16 bit (VRAM) decompression
+    MAX_DISTANCE = 0x1000
+    HASH_BITS = 14
+    HASH_SIZE = 1 << HASH_BITS
+    FAST_CHAIN_LENGTH = 16
+    BLOCK_TOKENS = 8
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline unsigned int hash3(const unsigned char[:] data, Py_ssize_t pos) noexcept nogil:
+    return ((data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2]) * 2654435761u) >> (32 - HASH_BITS)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void find_longest_matches(const unsigned char[:] data, int* lengths, int* distances, int* head, int* prev,
+                               int max_chain, bint all_positions) noexcept nogil:
+    """
+    Finds the longest match for every position of data using a hash chain of 3 byte sequences.
+
+    head must hold HASH_SIZE ints and prev one int per byte of data, they are used as the hash chain.
+    If all_positions is False, the search stops after the first position and continues at the end of
+    each match found (greedy parsing), so only those positions are filled.
+    """
+    cdef Py_ssize_t n = data.shape[0]
+    cdef Py_ssize_t pos = 0, candidate, max_len, length, skip_until = 0
+    cdef int chain
+    cdef unsigned int h
+    memset(head, 0xff, HASH_SIZE * sizeof(int))
+
+    for pos in range(n):
+        lengths[pos] = 0
+        distances[pos] = 0
+        if pos + MIN_MATCH > n:
+            continue
+        h = hash3(data, pos)
+        if all_positions or pos >= skip_until:
+            max_len = min(<Py_ssize_t> MAX_MATCH, n - pos)
+            candidate = head[h]
+            chain = 0
+            while candidate >= 0 and pos - candidate <= MAX_DISTANCE and chain < max_chain:
+                if pos - candidate >= MIN_DISTANCE:
+                    length = 0
+                    while length < max_len and data[candidate + length] == data[pos + length]:
+                        length += 1
+                    if length > lengths[pos]:
+                        lengths[pos] = <int> length
+                        distances[pos] = <int> (pos - candidate)
+                        if length == max_len:
+                            break
+                candidate = prev[candidate]
+                chain += 1
+            if lengths[pos] >= MIN_MATCH:
+                skip_until = pos + lengths[pos]
+            else:
+                lengths[pos] = 0
+                skip_until = pos + 1
+        prev[pos] = head[h]
+        head[h] = <int> pos
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef bytes compress(const unsigned char[:] data, int level=OPTIMAL):
+    """
+    Compresses data in LZ10 format.
+
+    Parameters
+    ----------
+    data : bytes
+        The data to compress.
+    level : int
+        FAST for greedy parsing, or OPTIMAL for the smallest output.
+
+    Returns
+    -------
+    bytes
+        The compressed data, with the LZ10 header.
+    """
+    cdef Py_ssize_t n = data.shape[0]
+    if n > 0xFFFFFF:
+        raise ValueError("LZ10 can only compress up to 16MB of data")
+    cdef int* lengths = NULL
+    cdef int* distances = NULL
+    cdef int* head = NULL
+    cdef int* prev = NULL
+    cdef int* costs = NULL
+    cdef unsigned char* choices = NULL
+    cdef Py_ssize_t i, l, best_length
+    cdef int best_cost, cost, r, next_r, flags_cost
+    cdef bint fast = level == FAST
+    cdef unsigned char[:] out_view
+    cdef Py_ssize_t out_pos = 4, flags_pos = 0, pos = 0
+    cdef int token = 8, disp
+
+    try:
+        lengths = <int*> malloc((n + 1) * sizeof(int))
+        distances = <int*> malloc((n + 1) * sizeof(int))
+        head = <int*> malloc(HASH_SIZE * sizeof(int))
+        prev = <int*> malloc((n + 1) * sizeof(int))
+        if lengths == NULL or distances == NULL or head == NULL or prev == NULL:
+            raise MemoryError()
+        if not fast:
+            # Optimal parse: minimal size in bytes of the data from each position to the end, for each
+            # number of tokens already used in the current block. The last block is padded, so the number
+            # of tokens affects the size too.
+            costs = <int*> malloc((n + 1) * BLOCK_TOKENS * sizeof(int))
+            choices = <unsigned char*> malloc(n * BLOCK_TOKENS + 1)
+            if costs == NULL or choices == NULL:
+                raise MemoryError()
+
+        with nogil:
+            if fast:
+                find_longest_matches(data, lengths, distances, head, prev, FAST_CHAIN_LENGTH, False)
+            else:
+                find_longest_matches(data, lengths, distances, head, prev, MAX_DISTANCE, True)
+                for r in range(BLOCK_TOKENS):
+                    costs[n * BLOCK_TOKENS + r] = BLOCK_TOKENS - r if r else 0
+                i = n - 1
+                while i >= 0:
+                    for r in range(BLOCK_TOKENS):
+                        next_r = (r + 1) % BLOCK_TOKENS
+                        flags_cost = 1 if r == 0 else 0
+                        best_cost = flags_cost + 1 + costs[(i + 1) * BLOCK_TOKENS + next_r]
+                        best_length = 1
+                        for l in range(MIN_MATCH, lengths[i] + 1):
+                            cost = flags_cost + 2 + costs[(i + l) * BLOCK_TOKENS + next_r]
+                            if cost < best_cost:
+                                best_cost = cost
+                                best_length = l
+                        costs[i * BLOCK_TOKENS + r] = best_cost
+                        choices[i * BLOCK_TOKENS + r] = <unsigned char> best_length
+                    i -= 1
+                i = 0
+                r = 0
+                while i < n:
+                    l = choices[i * BLOCK_TOKENS + r]
+                    lengths[i] = <int> l if l >= MIN_MATCH else 0
+                    i += l
+                    r = (r + 1) % BLOCK_TOKENS
+
+        out = bytearray(4 + n + (n + 7) // 8 + 8)
+        out_view = out
+        out_view[0] = 0x10
+        out_view[1] = n & 0xFF
+        out_view[2] = (n >> 8) & 0xFF
+        out_view[3] = (n >> 16) & 0xFF
+
+        with nogil:
+            while pos < n:
+                if token == 8:
+                    flags_pos = out_pos
+                    out_view[flags_pos] = 0
+                    out_pos += 1
+                    token = 0
+                if lengths[pos] >= MIN_MATCH:
+                    disp = distances[pos] - 1
+                    out_view[flags_pos] |= 0x80 >> token
+                    out_view[out_pos] = ((lengths[pos] - MIN_MATCH) << 4) | (disp >> 8)
+                    out_view[out_pos + 1] = disp & 0xFF
+                    out_pos += 2
+                    pos += lengths[pos]
+                else:
+                    out_view[out_pos] = data[pos]
+                    out_pos += 1
+                    pos += 1
+                token += 1
+            # Pad the last block with zeros, as ndspy does
+            if n > 0:
+                while token < 8:
+                    out_view[out_pos] = 0
+                    out_pos += 1
+                    token += 1
+    finally:
+        free(lengths)
+        free(distances)
+        free(head)
+        free(prev)
+        free(costs)
+        free(choices)
+    return bytes(out[:out_pos])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t decompress_blocks(const unsigned char[:] data, unsigned char[:] out, Py_ssize_t* in_pos,
+                                  Py_ssize_t out_pos, Py_ssize_t out_end) noexcept nogil:
+    """
+    Decompresses whole blocks of 8 tokens until out_end is reached, starting at in_pos and out_pos.
+
+    Returns the new position in the output, or -1 if the data is corrupted. The decompressed data may go past
+    out_end, up to the end of the output.
+    """
+    cdef Py_ssize_t size = out.shape[0], in_size = data.shape[0]
+    cdef Py_ssize_t source, length
+    cdef int flags, bit
+
+    while out_pos < out_end:
+        if in_pos[0] >= in_size:
+            return -1
+        flags = data[in_pos[0]]
+        in_pos[0] += 1
+        for bit in range(8):
+            if out_pos >= size:
+                break
+            if flags & (0x80 >> bit):
+                if in_pos[0] + 1 >= in_size:
+                    return -1
+                length = (data[in_pos[0]] >> 4) + MIN_MATCH
+                source = out_pos - (((data[in_pos[0]] & 0xF) << 8 | data[in_pos[0] + 1]) + 1)
+                in_pos[0] += 2
+                if source < 0:
+                    return -1
+                if length > size - out_pos:
+                    length = size - out_pos
+                while length > 0:
+                    out[out_pos] = out[source]
+                    out_pos += 1
+                    source += 1
+                    length -= 1
+            else:
+                if in_pos[0] >= in_size:
+                    return -1
+                out[out_pos] = data[in_pos[0]]
+                out_pos += 1
+                in_pos[0] += 1
+    return out_pos
+
+
+cdef Py_ssize_t read_header(const unsigned char[:] data) except -1:
+    if data.shape[0] < 4 or data[0] != 0x10:
+        raise TypeError("This isn't a LZ10-compressed file.")
+    return data[1] | data[2] << 8 | data[3] << 16
+
+
+cpdef bytes decompress(const unsigned char[:] data):
+    """
+    Decompresses LZ10 compressed data.
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed data, with the LZ10 header.
+
+    Returns
+    -------
+    bytes
+        The decompressed data.
+    """
+    cdef Py_ssize_t size = read_header(data)
+    cdef Py_ssize_t in_pos = 4, out_pos
+    out = bytearray(size)
+    cdef unsigned char[:] out_view = out
+    with nogil:
+        out_pos = decompress_blocks(data, out_view, &in_pos, 0, size)
+    if out_pos < 0:
+        raise ValueError("Corrupted LZ10 data")
+    return bytes(out)
+
+
+def decompress_chunks(const unsigned char[:] data, Py_ssize_t chunk_size):
+    """
+    Decompresses LZ10 compressed data incrementally.
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed data, with the LZ10 header.
+    chunk_size : int
+        Approximate size of each chunk.
+
+    Yields
+    ------
+    bytes
+        Consecutive chunks of the decompressed data.
+    """
+    cdef Py_ssize_t size = read_header(data)
+    cdef Py_ssize_t in_pos = 4, out_pos = 0, chunk_start = 0
+    # The whole output is kept, as matches can refer to data up to 4KB back
+    out = bytearray(size)
+    cdef unsigned char[:] out_view = out
+    while out_pos < size:
+        with nogil:
+            out_pos = decompress_blocks(data, out_view, &in_pos, out_pos, min(out_pos + chunk_size, size))
+        if out_pos < 0:
+            raise ValueError("Corrupted LZ10 data")
+        yield bytes(out_view[chunk_start:out_pos])
+        chunk_start = out_pos
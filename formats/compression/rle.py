@@ -1,8 +1,25 @@
 from formats.binary import BinaryReader, BinaryWriter
+from typing import *
+import numpy as np
+
+MAX_RUN = 130
+"""Maximum length of a compressed block."""
+MAX_LITERAL = 128
+"""Maximum length of an uncompressed block."""
+
+
+def _split_blocks(starts: np.ndarray, lengths: np.ndarray, max_length: int):
+    """
+    Splits each stretch of data into blocks of max_length, the last block taking the remainder.
+    """
+    n_blocks = -(-lengths // max_length)
+    stretch = np.repeat(np.arange(len(starts)), n_blocks)
+    block_i = np.arange(len(stretch)) - np.repeat(np.cumsum(n_blocks) - n_blocks, n_blocks)
+    block_starts = starts[stretch] + block_i * max_length
+    return block_starts, np.minimum(max_length, lengths[stretch] - block_i * max_length)
 
 
 def compress(data: bytes):
-    rdr = BinaryReader(data)
     wtr = BinaryWriter()
 
     wtr.write_uint8(0x30)  # rle identifier
@@ -10,84 +27,99 @@ def compress(data: bytes):
     wtr.write_uint24(len(data) if len(data) < 0xffffff else 0)
     if len(data) > 0xffffff:
         wtr.write_uint32(len(data))
+    if not data:
+        return wtr.data
 
-    rep_count = 1
-    current_block_length = 0
-    data_block = [0 for _ in range(130)]
-    while rdr.c < len(rdr.data):
-        found_repetition = False
-        while current_block_length < 130 and rdr.c < len(rdr.data):
-            next_byte = rdr.read_uint8()
-            data_block[current_block_length] = next_byte
-            current_block_length += 1
-            if current_block_length > 1:
-                if next_byte == data_block[current_block_length - 2]:
-                    rep_count += 1
-                else:
-                    rep_count = 1
-            found_repetition = rep_count > 2
-            if found_repetition:
-                break
-        if found_repetition:
-            num_uncomp_to_copy = current_block_length - 3
-        else:
-            num_uncomp_to_copy = min(current_block_length, 130 - 2)
-
-        if num_uncomp_to_copy > 0:
-            flag = num_uncomp_to_copy - 1
-            wtr.write_uint8(flag)
-            for i in range(num_uncomp_to_copy):
-                wtr.write_uint8(data_block[i])
-            for i in range(num_uncomp_to_copy, current_block_length):
-                data_block[i - num_uncomp_to_copy] = data_block[i]
-            current_block_length -= num_uncomp_to_copy
-        if found_repetition:
-            while current_block_length < 130 and rdr.c < len(rdr.data):
-                next_byte = rdr.read_uint8()
-                data_block[current_block_length] = next_byte
-                current_block_length += 1
-                if next_byte != data_block[0]:
-                    break
-                else:
-                    rep_count += 1
-            flag = 0x80 | (rep_count - 3)
-            wtr.write_uint8(flag)
-            wtr.write_uint8(data_block[0])
-            if rep_count != current_block_length:
-                data_block[0] = data_block[current_block_length - 1]
-            current_block_length -= rep_count
-
-    if current_block_length > 0:
-        flag = current_block_length - 1
-        wtr.write_uint8(flag)
-        for i in range(current_block_length):
-            wtr.write_uint8(data_block[i])
+    data = np.frombuffer(data, np.uint8)
+
+    # Repetitions of 3 bytes or more are compressed, in blocks of up to 130 bytes. If less than 3 bytes are left
+    # after the last full block, they are stored uncompressed.
+    rep_starts = np.flatnonzero(np.concatenate(([True], data[1:] != data[:-1])))
+    rep_lengths = np.diff(np.append(rep_starts, len(data)))
+    rep_starts, rep_lengths = rep_starts[rep_lengths >= 3], rep_lengths[rep_lengths >= 3]
+    full_lengths = rep_lengths - np.where(rep_lengths % MAX_RUN < 3, rep_lengths % MAX_RUN, 0)
+    run_starts, run_lengths = _split_blocks(rep_starts, full_lengths, MAX_RUN)
+
+    # Everything else is stored uncompressed, in blocks of up to 128 bytes
+    coverage = np.zeros(len(data) + 1, np.int64)
+    np.add.at(coverage, run_starts, 1)
+    np.add.at(coverage, run_starts + run_lengths, -1)
+    is_literal = np.concatenate(([0], np.cumsum(coverage[:-1]) == 0, [0])).astype(np.int8)
+    edges = np.diff(is_literal)
+    stretch_starts = np.flatnonzero(edges == 1)
+    literal_starts, literal_lengths = _split_blocks(stretch_starts, np.flatnonzero(edges == -1) - stretch_starts,
+                                                    MAX_LITERAL)
+
+    # Lay out the blocks in order
+    starts = np.concatenate((run_starts, literal_starts))
+    order = np.argsort(starts, kind="stable")
+    is_run = np.concatenate((np.ones(len(run_starts), bool), np.zeros(len(literal_starts), bool)))[order]
+    lengths = np.concatenate((run_lengths, literal_lengths))[order]
+    starts = starts[order]
+    block_sizes = np.where(is_run, 2, lengths + 1)
+    offsets = np.cumsum(block_sizes) - block_sizes
 
+    out = np.zeros(int(block_sizes.sum()), np.uint8)
+    out[offsets] = np.where(is_run, 0x80 | (lengths - 3), lengths - 1)
+    out[offsets[is_run] + 1] = data[starts[is_run]]
+    literal_offsets = offsets[~is_run]
+    literal_positions = np.flatnonzero(is_literal[1:-1])
+    out[literal_positions + np.repeat(literal_offsets + 1 - literal_starts, literal_lengths)] = data[literal_positions]
+
+    wtr.write_array(out)
     return wtr.data
 
 
 def decompress(data: bytes):
+    return b"".join(decompress_chunks(data))
+
+
+def decompress_chunks(data: bytes, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Decompresses RLE compressed data incrementally.
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed data, with the RLE header.
+    chunk_size : int
+        Approximate size of each chunk. By default the data is decompressed in a single chunk.
+
+    Yields
+    ------
+    bytes
+        Consecutive chunks of the decompressed data.
+    """
     rdr = BinaryReader(data)
-    wtr = BinaryWriter()
     type_ = rdr.read_uint8()
     if type_ != 0x30:
         raise Exception("Tried to decompress commands that isn't RLE")
     ds = rdr.read_uint24()
     if ds == 0:
-        rdr.read_uint32()
-
-    while True:
-        flag = rdr.read_uint8()
-        if flag is None:
-            break  # we've hit the end
-        compressed = (flag & 0x80) > 0
-        length = flag & 0x7f
-        length += 3 if compressed else 1
-        if compressed:
-            next_ = rdr.read_uint8()
-            for i in range(length):
-                wtr.write_uint8(next_)
+        ds = rdr.read_uint32() or 0  # empty data has no extended size
+    if chunk_size is None:
+        chunk_size = ds
+
+    data = bytes(data)
+    out = bytearray(ds)
+    view = memoryview(out)
+    pos = 0
+    chunk_start = 0
+    c = rdr.c
+    while pos < ds and c < len(data):
+        flag = data[c]
+        c += 1
+        if flag & 0x80:
+            block = data[c:c + 1] * min((flag & 0x7f) + 3, ds - pos)
+            c += 1
         else:
-            wtr.write(rdr.read(length))
+            block = data[c:c + min(flag + 1, ds - pos)]
+            c += flag + 1
+        out[pos:pos + len(block)] = block
+        pos += len(block)
+        if pos - chunk_start >= chunk_size:
+            yield bytes(view[chunk_start:pos])
+            chunk_start = pos
 
-    return wtr.data
+    if pos > chunk_start:  # we've hit the end
+        yield bytes(view[chunk_start:pos])
@@ -5,3 +5,35 @@ Global configuration for the formats module.
 # Global language (from rom)
 DEBUG_PUZZLE = False
 DEBUG_AUDIO = False
+
+# Number of processes used to compress archives when saving the rom (None uses all the cpus, 1 compresses
+# serially on the calling thread)
+COMPRESSION_WORKERS = None
+
+# Directory of the on-disk cache of compressed data (None disables the cache)
+COMPRESSION_CACHE_PATH = None
+# Maximum size of the compression cache in bytes
+COMPRESSION_CACHE_SIZE = 256 * 1024 * 1024
+
+# Level used by the native LZ10 compressor: 0 compresses faster, 1 produces the smallest output
+LZ10_COMPRESSION_LEVEL = 1
+
+# Whether compressed files are saved with the smallest container the game can load for them, instead of LZ10
+BEST_COMPRESSION = False
+
+# Whether the files of plz archives are kept as views over the archive data until they are written, instead of
+# being copied when the archive is opened
+LAZY_PLZ_MEMBERS = True
+
+# Maximum size in bytes of the plz archives kept loaded by a rom, the least recently used unmodified archives are
+# released when it's exceeded
+ARCHIVE_CACHE_SIZE = 128 * 1024 * 1024
+
+# Whether identical files are saved once in the rom, with all of their FAT entries pointing to the same data
+DEDUPLICATE_FILES = False
+
+# Maximum size in bytes of the decoded sprites and backgrounds kept in memory by the previewers
+SPRITE_CACHE_SIZE = 64 * 1024 * 1024
+
+# Number of threads decoding the sprites and backgrounds of the previewers ahead of time
+PREFETCH_WORKERS = 4
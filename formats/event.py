@@ -289,9 +289,8 @@ class Event:
         if self.rom is None:
             return
         text_lst = {}
-        dial_files = self._texts_archive.filenames
         prefix, postfix, complete = self._resolve_event_id()
-        for filename in dial_files:
+        for filename in self._texts_archive.glob(f"t{prefix}_{postfix}_*.gds"):
             if match := re.match(f"t{prefix}_{postfix}_([0-9]+).gds", filename):
                 text_lst[int(match.group(1))] = filename
         return text_lst
@@ -1,10 +1,24 @@
+import bisect
+import fnmatch
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableSequence
+import hashlib
 import io
+import logging
+import mmap
 import os
 import re
+import struct
+import weakref
+from dataclasses import dataclass
 
+import ndspy.fnt
 import ndspy.rom
+from ndspy._common import crc16
 from ndspy.fnt import *
 
+from formats import conf
 from formats.binary import *
 from .compression import *
 
@@ -18,6 +32,55 @@ class Archive:
     opened_files: list = []
     """List of the currently opened files."""
 
+    def __init__(self, *args, **kwargs):
+        self._dirty = False
+        """Whether the archive has been modified since it was loaded or last saved."""
+        self._dirty_files: Set[int] = set()
+        """Ids of the files whose data has changed since the archive was loaded or last saved."""
+        self._on_dirty: Optional[Callable[["Archive"], None]] = None
+        """Called when the archive goes from saved to modified, used to keep modified archives loaded."""
+        super().__init__(*args, **kwargs)
+
+    @property
+    def is_dirty(self) -> bool:
+        """Whether the archive has been modified since it was loaded or last saved."""
+        return self._dirty
+
+    @property
+    def dirty_files(self) -> Set[int]:
+        """Ids of the files whose data has changed since the archive was loaded or last saved."""
+        return self._dirty_files
+
+    def mark_dirty(self, index: Optional[int] = None):
+        """
+        Marks the archive as modified.
+
+        Parameters
+        ----------
+        index : int
+            The id of the file whose data changed, if any.
+        """
+        was_dirty = self._dirty
+        self._dirty = True
+        if index is not None:
+            self._dirty_files.add(index)
+        if not was_dirty and self._on_dirty is not None:
+            self._on_dirty(self)
+
+    def clear_dirty(self):
+        """
+        Marks the archive as saved.
+        """
+        self._dirty = False
+        self._dirty_files = set()
+
+    def _shift_dirty_files(self, start_id: int, amount: int):
+        """
+        Shifts the ids of the dirty files from start_id on, after files have been added or removed.
+        """
+        self._dirty_files = {file_id + amount if file_id >= start_id else file_id
+                             for file_id in self._dirty_files}
+
     def open(self, file: Union[AnyStr, int], mode: str = "rb") -> Union[io.BytesIO, io.TextIOWrapper]:
         pass
 
@@ -93,7 +156,10 @@ class RomFile(io.BytesIO):
     def flush(self):
         if not self.closed:
             if self.opp != "r":
-                self.archive.files[self.id] = self.getvalue()
+                value = self.getvalue()
+                if value != self.archive.files[self.id]:
+                    self.archive.files[self.id] = value
+                    self.archive.mark_dirty(self.id)
             super().flush()
 
     def __enter__(self):
@@ -112,7 +178,7 @@ class CompressedIOWrapper(io.BytesIO):
     """
     Wrapper for a compressed file.
     """
-    def __init__(self, stream, double_typed: Optional[bool] = None):
+    def __init__(self, stream, double_typed: Optional[bool] = None, lazy: bool = False):
         """
         Parameters
         ----------
@@ -120,12 +186,98 @@ class CompressedIOWrapper(io.BytesIO):
             Stream to use for internal data.
         double_typed : bool
             Whether the file has its compression type specified twice.
+        lazy : bool
+            Whether to decompress the data only as far as it is read, instead of all at once. Lazy wrappers
+            are read only.
         """
         self._stream = stream
+        self._lazy = lazy
+        self._chunks: Optional[Iterator[bytes]] = None
+        """Chunks of the data which haven't been decompressed yet, when lazy."""
+        self._decompressed_size = 0
+
+        data = stream.read()
+        if lazy:
+            self._chunks, self.double_typed = decompress_chunks(data, double_typed)
+            super().__init__()
+        else:
+            current, self.double_typed = decompress(data, double_typed)
+            super().__init__(current)
+        self.compression_type: Optional[int] = compression_type_of(data, self.double_typed)
+        """The compression type of the data, or None if it's empty."""
+
+    def _decompress_until(self, position: Optional[int] = None):
+        """
+        Decompresses the data up to the specified position, or up to the end if it's None.
+        """
+        if self._chunks is None or (position is not None and position <= self._decompressed_size):
+            return
+        current = super().tell()
+        super().seek(0, io.SEEK_END)
+        while position is None or self._decompressed_size < position:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._chunks = None
+                break
+            super().write(chunk)
+            self._decompressed_size += len(chunk)
+        super().seek(current)
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        self._decompress_until(None if size is None or size < 0 else self.tell() + size)
+        return super().read(size)
+
+    def read1(self, size: Optional[int] = -1) -> bytes:
+        self._decompress_until(None if size is None or size < 0 else self.tell() + size)
+        return super().read1(size)
+
+    def readinto(self, buffer) -> int:
+        self._decompress_until(self.tell() + len(memoryview(buffer)))
+        return super().readinto(buffer)
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        self._decompress_until()
+        return super().readline(size)
+
+    def readlines(self, hint: Optional[int] = -1) -> List[bytes]:
+        self._decompress_until()
+        return super().readlines(hint)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            self._decompress_until()
+        return super().seek(offset, whence)
+
+    @property
+    def getvalue_is_cheap(self) -> bool:
+        """Whether getvalue returns the data without decompressing the rest of it first."""
+        return self._chunks is None
+
+    def getvalue(self) -> bytes:
+        self._decompress_until()
+        return super().getvalue()
+
+    def getbuffer(self) -> memoryview:
+        self._decompress_until()
+        return super().getbuffer()
 
-        current, self.double_typed = decompress(stream.read(), double_typed)
+    def writable(self) -> bool:
+        return not self._lazy
+
+    def write(self, b) -> int:
+        if self._lazy:
+            raise io.UnsupportedOperation("lazy compressed files are read only")
+        return super().write(b)
 
-        super().__init__(current)
+    def writelines(self, lines) -> None:
+        if self._lazy:
+            raise io.UnsupportedOperation("lazy compressed files are read only")
+        super().writelines(lines)
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        if self._lazy:
+            raise io.UnsupportedOperation("lazy compressed files are read only")
+        return super().truncate(size)
 
     def close(self):
         self.flush()
@@ -133,10 +285,13 @@ class CompressedIOWrapper(io.BytesIO):
         self._stream.close()
 
     def flush(self):
-        if self._stream.writable():
+        if not self._lazy and self._stream.writable():
+            data = compress(self.getvalue(), BEST if conf.BEST_COMPRESSION else LZ10,
+                            double_typed=self.double_typed)
+            self.compression_type = compression_type_of(data, self.double_typed)
             self._stream.truncate(0)
             self._stream.seek(0)
-            self._stream.write(compress(self.getvalue(), double_typed=self.double_typed))
+            self._stream.write(data)
         super().flush()
         self._stream.flush()
 
@@ -145,12 +300,478 @@ class CompressedIOWrapper(io.BytesIO):
         return self
 
 
+class RomFileIndex:
+    """
+    Hash index of the file and folder paths of a NintendoDSRom.
+
+    The index is built once from the filename table, and kept up to date by the NintendoDSRom methods
+    that modify the filesystem, so that path lookups don't need to walk the folder tree.
+    """
+    def __init__(self, root: Folder):
+        self._root = root
+        self._files: Dict[str, Tuple[Folder, int]] = {}
+        """Path of each file mapped to its folder and its position inside the folder."""
+        self._folders: Dict[str, Folder] = {}
+        """Path of each folder mapped to the folder."""
+        self._lower_paths: Dict[str, str] = {}
+        """Lowercase path of each file mapped to its path."""
+        self._sorted_paths: List[str] = []
+        """Sorted list of the file paths, used for prefix lookups."""
+        self._id_to_path: Optional[Dict[int, str]] = None
+        """File id mapped to its path. Built on demand, as ids change when files are added or removed."""
+        self.rebuild()
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        """
+        Normalizes a path, so that it has no leading or trailing slash.
+        """
+        return path.strip("/")
+
+    def rebuild(self, root: Folder = None):
+        """
+        Builds the index again from the filename table.
+
+        Parameters
+        ----------
+        root : Folder
+            New root of the filename table. Defaults to the current root.
+        """
+        if root is not None:
+            self._root = root
+        self._files = {}
+        self._folders = {"": self._root}
+        self._lower_paths = {}
+        self._id_to_path = None
+
+        def index_folder(path, folder: Folder):
+            for position, filename in enumerate(folder.files):
+                file_path = path + filename
+                self._files[file_path] = (folder, position)
+                self._lower_paths[file_path.lower()] = file_path
+            for folder_name, subfolder in folder.folders:
+                self._folders[path + folder_name] = subfolder
+                index_folder(path + folder_name + "/", subfolder)
+
+        index_folder("", self._root)
+        self._sorted_paths = sorted(self._files)
+
+    def __contains__(self, path: str) -> bool:
+        return self.normalize(path) in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def id_of(self, path: str) -> Optional[int]:
+        """
+        Gets the id of the file at the specified path, or None if it doesn't exist.
+        """
+        entry = self._files.get(self.normalize(path))
+        if entry is None:
+            return None
+        folder, position = entry
+        return folder.firstID + position
+
+    def path_of(self, file_id: int) -> Optional[str]:
+        """
+        Gets the path of the file with the specified id, or None if it doesn't exist.
+        """
+        if self._id_to_path is None:
+            self._id_to_path = {folder.firstID + position: path
+                                for path, (folder, position) in self._files.items()}
+        return self._id_to_path.get(file_id)
+
+    def folder(self, path: str) -> Optional[Folder]:
+        """
+        Gets the folder at the specified path, or None if it doesn't exist.
+        """
+        return self._folders.get(self.normalize(path))
+
+    def find_case_insensitive(self, path: str) -> Optional[str]:
+        """
+        Gets the path of the file matching the specified path ignoring case, or None if there is none.
+        """
+        return self._lower_paths.get(self.normalize(path).lower())
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        """
+        Gets the paths of all files starting with the specified prefix, sorted.
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix, for example "data_lt2/bg/" for all backgrounds or "data_lt2/event/ev_d" for the event
+            archives.
+        """
+        prefix = prefix.lstrip("/")
+        start = bisect.bisect_left(self._sorted_paths, prefix)
+        end = start
+        while end < len(self._sorted_paths) and self._sorted_paths[end].startswith(prefix):
+            end += 1
+        return self._sorted_paths[start:end]
+
+    # Updates from the ROM
+
+    def file_added(self, path: str, folder: Folder, position: int):
+        path = self.normalize(path)
+        self._files[path] = (folder, position)
+        self._lower_paths[path.lower()] = path
+        bisect.insort(self._sorted_paths, path)
+        self._id_to_path = None
+
+    def file_removed(self, path: str):
+        path = self.normalize(path)
+        folder, position = self._drop_path(path)
+        # The files after the removed one move one position back inside the folder.
+        folder_path = path.rpartition("/")[0]
+        folder_path = folder_path + "/" if folder_path else ""
+        for moved_position in range(position, len(folder.files)):
+            self._files[folder_path + folder.files[moved_position]] = (folder, moved_position)
+        self._id_to_path = None
+
+    def file_renamed(self, old_path: str, new_path: str):
+        old_path, new_path = self.normalize(old_path), self.normalize(new_path)
+        entry = self._drop_path(old_path)
+        self._files[new_path] = entry
+        self._lower_paths[new_path.lower()] = new_path
+        bisect.insort(self._sorted_paths, new_path)
+        if self._id_to_path is not None:
+            self._id_to_path[entry[0].firstID + entry[1]] = new_path
+
+    def _drop_path(self, path: str) -> Tuple[Folder, int]:
+        entry = self._files.pop(path)
+        if self._lower_paths.get(path.lower()) == path:
+            del self._lower_paths[path.lower()]
+        del self._sorted_paths[bisect.bisect_left(self._sorted_paths, path)]
+        return entry
+
+    def folder_added(self, path: str, folder: Folder):
+        self._folders[self.normalize(path)] = folder
+
+    def folder_removed(self, path: str):
+        self._folders.pop(self.normalize(path), None)
+
+    def folder_renamed(self, old_path: str, new_path: str):
+        old_path, new_path = self.normalize(old_path), self.normalize(new_path)
+        for folder_path in list(self._folders):
+            if folder_path == old_path or folder_path.startswith(old_path + "/"):
+                self._folders[new_path + folder_path[len(old_path):]] = self._folders.pop(folder_path)
+        for file_path in self.with_prefix(old_path + "/"):
+            new_file_path = new_path + file_path[len(old_path):]
+            self._files[new_file_path] = self._files.pop(file_path)
+            if self._lower_paths.get(file_path.lower()) == file_path:
+                del self._lower_paths[file_path.lower()]
+            self._lower_paths[new_file_path.lower()] = new_file_path
+        self._sorted_paths = sorted(self._files)
+        self._id_to_path = None
+
+
+class RomBatch:
+    """
+    Group of filesystem changes to a NintendoDSRom, renumbered all at once. Created by NintendoDSRom.batch.
+
+    While the batch is open, added files get temporary ids after the existing files and removed files keep their
+    ids, so the ids of the other files don't change. When the batch exits, the files list, the folder first ids,
+    the dirty files and the opened files are renumbered in a single pass, and the file index is rebuilt once.
+    """
+    def __init__(self, rom: "NintendoDSRom"):
+        self.rom = rom
+        self.file_count = len(rom.files)
+        """Number of files in the ROM when the batch was opened, the ids from it on are temporary."""
+        self.added: Dict[str, Tuple[Folder, str, int]] = {}
+        """Path of each added file mapped to its folder, its filename and its temporary id."""
+        self.removed: Dict[int, Tuple[Folder, str]] = {}
+        """Id of each removed file mapped to its folder and its filename."""
+        self._depth = 0
+
+    def __enter__(self):
+        if self._depth == 0:
+            self.file_count = len(self.rom.files)
+            self.rom._batch = self
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self._depth -= 1
+        if self._depth == 0:
+            self.rom._batch = None
+            self.apply()
+
+    def file_id(self, path: str) -> Optional[int]:
+        """
+        Gets the current id of the file at the specified path, or None if it doesn't exist.
+        """
+        path = RomFileIndex.normalize(path)
+        if path in self.added:
+            return self.added[path][2]
+        file_id = self.rom.file_index.id_of(path)
+        return None if file_id in self.removed else file_id
+
+    def path_of(self, file_id: int) -> Optional[str]:
+        """
+        Gets the current path of the file with the specified id, or None if it doesn't exist.
+        """
+        if file_id >= self.file_count:
+            for path, (_folder, _filename, added_id) in self.added.items():
+                if added_id == file_id:
+                    return path
+            return None
+        return None if file_id in self.removed else self.rom.file_index.path_of(file_id)
+
+    def add_file(self, path: str) -> Optional[int]:
+        folder_name, filename = os.path.split(RomFileIndex.normalize(path))
+        folder = self.rom.file_index.folder(folder_name)
+        if folder is None:
+            return None
+        file_id = len(self.rom.files)
+        self.rom.files.append(b"")
+        self.rom.mark_dirty(file_id)
+        self.added[RomFileIndex.normalize(path)] = (folder, filename, file_id)
+        return file_id
+
+    def remove_file(self, path: str):
+        path = RomFileIndex.normalize(path)
+        if self.added.pop(path, None) is not None:  # its temporary id is dropped when applied
+            return
+        file_id = self.file_id(path)
+        if file_id is None:
+            raise FileNotFoundError(f"file '{path}' could not be removed")
+        folder_name, filename = os.path.split(path)
+        self.removed[file_id] = (self.rom.file_index.folder(folder_name), filename)
+
+    def rename_file(self, path: str, new_filename: str):
+        folder, _filename, file_id = self.added.pop(RomFileIndex.normalize(path))
+        new_path = RomFileIndex.normalize(os.path.split(path)[0] + "/" + new_filename)
+        self.added[new_path] = (folder, new_filename, file_id)
+
+    def apply(self):
+        """
+        Applies the changes to the ROM.
+        """
+        rom = self.rom
+        if len(rom.files) == self.file_count and not self.removed:
+            return
+
+        folders = []
+        stack = [rom.filenames]
+        while stack:
+            folder = stack.pop()
+            folders.append(folder)
+            stack.extend(subfolder for _name, subfolder in reversed(folder.folders))
+
+        added_ids: Dict[int, List[int]] = {}
+        added_names: Dict[int, List[str]] = {}
+        for folder, filename, file_id in self.added.values():
+            added_ids.setdefault(id(folder), []).append(file_id)
+            added_names.setdefault(id(folder), []).append(filename)
+        removed_names: Dict[int, Set[str]] = {}
+        for folder, filename in self.removed.values():
+            removed_names.setdefault(id(folder), set()).add(filename)
+
+        # The added files go after the last file of their folder. Folders without files start at their first id,
+        # before the files of the folder starting there, or at the end for folders created during the batch.
+        ends: Dict[int, List[Folder]] = {}
+        empty_starts: Dict[int, List[Folder]] = {}
+        starts: Dict[int, List[Folder]] = {}
+        for folder in folders:
+            if folder.files:
+                starts.setdefault(folder.firstID, []).append(folder)
+                ends.setdefault(folder.firstID + len(folder.files), []).append(folder)
+            else:
+                empty_starts.setdefault(min(folder.firstID, self.file_count), []).append(folder)
+
+        files = []
+        new_ids = [-1] * len(rom.files)
+        first_ids: Dict[int, int] = {}
+
+        def append_added(folder_):
+            for added_id in added_ids.get(id(folder_), ()):
+                new_ids[added_id] = len(files)
+                files.append(rom.files[added_id])
+
+        for file_id in range(self.file_count + 1):
+            for folder in ends.get(file_id, ()):
+                append_added(folder)
+            for folder in empty_starts.get(file_id, ()):
+                first_ids[id(folder)] = len(files)
+                append_added(folder)
+            for folder in starts.get(file_id, ()):
+                first_ids[id(folder)] = len(files)
+            if file_id < self.file_count and file_id not in self.removed:
+                new_ids[file_id] = len(files)
+                files.append(rom.files[file_id])
+
+        # Close the opened files which have been removed, and renumber the rest
+        for fp in [fp for fp in rom.opened_files if fp.archive is rom]:
+            if new_ids[fp.id] < 0:
+                fp.close()
+        for fp in [fp for fp in rom.opened_files if fp.archive is rom]:
+            fp.id = new_ids[fp.id]
+
+        rom.files = files
+        for folder in folders:
+            folder.firstID = first_ids[id(folder)]
+            if id(folder) in removed_names:
+                folder.files[:] = [name for name in folder.files if name not in removed_names[id(folder)]]
+            folder.files.extend(added_names.get(id(folder), ()))
+        rom._dirty_files = {new_ids[file_id] for file_id in rom.dirty_files if new_ids[file_id] >= 0}
+        rom.mark_dirty()
+        rom._files_moved = True
+        rom._layout_version += 1
+        rom.file_index.rebuild()
+
+        self.added = {}
+        self.removed = {}
+
+
+class ArchiveCache:
+    """
+    Cache of the plz archives loaded from a NintendoDSRom.
+
+    Archives are evicted in least recently used order when their total size exceeds max_size. Archives which
+    have been modified, or which have files open, are kept until they are saved or closed. Evicted archives
+    are only weakly referenced, so an evicted archive still in use somewhere is returned again instead of
+    being loaded a second time. An evicted archive which is modified is cached again, so that it's saved.
+    """
+    def __init__(self, max_size: int):
+        """
+        Parameters
+        ----------
+        max_size : int
+            Maximum size in bytes of the data of all the cached archives together.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        """Number of lookups which found the archive loaded."""
+        self.misses = 0
+        """Number of lookups which needed to load the archive."""
+        self.evictions = 0
+        """Number of archives evicted from the cache."""
+
+        self._archives: OrderedDict[str, "PlzArchive"] = OrderedDict()
+        """Cached archives by path, ordered from least to most recently used."""
+        self._sizes: Dict[str, int] = {}
+        """Size of each cached archive, as of its last lookup."""
+        self._evicted: weakref.WeakValueDictionary[str, "PlzArchive"] = weakref.WeakValueDictionary()
+        """Evicted archives by path, while they're still referenced elsewhere."""
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached archives."""
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._archives)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._archives
+
+    def get(self, path: str) -> Optional["PlzArchive"]:
+        """
+        Gets the archive loaded from the path, or None if it isn't loaded.
+        """
+        archive = self._archives.get(path)
+        if archive is None:
+            archive = self._evicted.pop(path, None)
+            if archive is None:
+                self.misses += 1
+                return None
+            archive._on_dirty = None
+            self._archives[path] = archive
+        self._archives.move_to_end(path)
+        self._sizes[path] = archive.memory_size
+        self.hits += 1
+        self.evict()
+        return archive
+
+    def put(self, path: str, archive: "PlzArchive"):
+        """
+        Adds a loaded archive, evicting the least recently used archives if needed.
+        """
+        self._archives[path] = archive
+        self._archives.move_to_end(path)
+        self._sizes[path] = archive.memory_size
+        self.evict()
+
+    def evict(self):
+        """
+        Evicts the least recently used archives not in use until the cache fits in max_size.
+        """
+        size = self.size
+        for path, archive in list(self._archives.items()):
+            if size <= self.max_size:
+                break
+            if archive.is_dirty or any(file.archive is archive for file in archive.opened_files):
+                continue
+            del self._archives[path]
+            size -= self._sizes.pop(path)
+            self._evicted[path] = archive
+            archive._on_dirty = lambda archive_, path_=path: self._restore(path_, archive_)
+            self.evictions += 1
+
+    def _restore(self, path: str, archive: "PlzArchive"):
+        """
+        Caches again an evicted archive which has been modified.
+        """
+        archive._on_dirty = None
+        if self._evicted.get(path) is not archive:
+            return
+        del self._evicted[path]
+        self._archives[path] = archive
+        self._sizes[path] = archive.memory_size
+
+    def archives(self) -> List["PlzArchive"]:
+        """
+        Gets all the loaded archives, including evicted archives still in use.
+        """
+        evicted = [archive for path, archive in list(self._evicted.items()) if path not in self._archives]
+        return list(self._archives.values()) + evicted
+
+    def __str__(self):
+        return (f"{len(self)} archives loaded ({self.size} bytes of {self.max_size}), {self.hits} hits, "
+                f"{self.misses} misses, {self.evictions} evictions")
+
+
+@dataclass
+class SaveSummary:
+    """
+    Dataclass summarizing what was rewritten when saving a NintendoDSRom.
+    """
+    archives_rewritten: int = 0
+    """Number of loaded archives which were modified and rebuilt."""
+    archives_skipped: int = 0
+    """Number of loaded archives which were not modified, and kept their original data."""
+    archive_files_rewritten: int = 0
+    """Number of files inside the rebuilt archives whose data changed."""
+    files_rewritten: int = 0
+    """Number of files in the ROM whose data changed (including rebuilt archives)."""
+    best_compression: Optional[BestCompressionReport] = None
+    """Results of the files compressed with the smallest container since the previous save."""
+    files_deduplicated: int = 0
+    """Number of files which share the data of an identical file instead of being written again."""
+    bytes_deduplicated: int = 0
+    """Size of the data of the deduplicated files, not counting the alignment padding also saved."""
+    files_moved: Optional[int] = None
+    """When the ROM file was updated in place, number of changed files which didn't fit in their old space."""
+
+    def __str__(self):
+        summary = (f"{self.files_rewritten} ROM files rewritten, {self.archives_rewritten} archives rebuilt "
+                   f"({self.archive_files_rewritten} files changed), {self.archives_skipped} archives unchanged")
+        if self.best_compression is not None and self.best_compression.payloads:
+            summary += f", {self.best_compression}"
+        if self.files_moved is not None:
+            summary += f", written in place ({self.files_moved} files moved to the end)"
+        if self.files_deduplicated:
+            summary += f", {self.files_deduplicated} duplicate files sharing data ({self.bytes_deduplicated} bytes " \
+                       f"reclaimed)"
+        return summary
+
+
 class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
     """
     Archive wrapping around ndspy.rom.NintendoDSRom
     """
     opened_files: List[RomFile]
-    _loaded_archives: dict
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -176,10 +797,272 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
 
         self._opened_files = []
         """List of currently opened files."""
-        self._loaded_archives: Dict[str, PlzArchive] = {}
-        """List of currently loaded archives."""
+        self.archive_cache = ArchiveCache(conf.ARCHIVE_CACHE_SIZE)
+        """Cache of the loaded archives."""
 
         self._get_archive_call = False
+        self._batch: Optional[RomBatch] = None
+        """Batch of filesystem changes currently open, if any."""
+
+        self._mapping: Optional[mmap.mmap] = None
+        """Memory map backing the lazily loaded files, if the ROM was opened mapped."""
+        self._mapped_path: Optional[str] = None
+        """Path of the memory mapped ROM file."""
+        self._mapped_views: List[Tuple[memoryview, int, int]] = []
+        """Views over the memory map created for the files, with the range of the ROM file they cover."""
+        self._synced_path: Optional[str] = None
+        """Path of the ROM file which matches the ROM as of its last save, and can be updated in place."""
+        self._files_moved = False
+        """Whether files have been added or removed since the last save, which changes the ids of other files."""
+        self._layout_version = 0
+        """Number of times files have been added or removed."""
+        self._file_versions: Dict[int, int] = {}
+        """Number of times the data of each file has changed, by id."""
+
+        self.file_index = RomFileIndex(self.filenames)
+        """Index of the paths of the files and folders in the ROM."""
+
+        self.last_save_summary: Optional[SaveSummary] = None
+        """Summary of the last save of the ROM."""
+
+    @classmethod
+    def fromFile(cls, filePath, mapped: bool = False):
+        """
+        Load a ROM from a filesystem file.
+
+        Parameters
+        ----------
+        filePath : str
+            Path of the ROM file.
+        mapped : bool
+            If True, the ROM file is memory mapped and the entries of `files` are read-only views
+            over the map, which are only copied into memory when written through a RomFile.
+            Otherwise, the whole ROM is read into memory.
+
+        Returns
+        -------
+        NintendoDSRom
+            The loaded ROM.
+        """
+        if not mapped:
+            self = super(NintendoDSRom, cls).fromFile(filePath)
+        else:
+            mapping = cls._map_file(filePath)
+            self = cls(cls._mapped_header_image(mapping))
+            self._attach_mapping(mapping, filePath)
+        self._synced_path = os.path.abspath(filePath)
+        return self
+
+    @staticmethod
+    def _map_file(path) -> mmap.mmap:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _mapped_header_image(mapping: mmap.mmap) -> bytes:
+        """
+        Builds a copy of the ROM data up to the end of the last header structure (arm9, arm7, FNT,
+        overlay tables, icon banner...), with an empty FAT, so that ndspy can parse it without
+        reading any of the file data.
+        """
+        arm9_offset, _, _, arm9_len, arm7_offset, _, _, arm7_len = struct.unpack_from("<8I", mapping, 0x20)
+        fnt_offset, fnt_len, _, _, ovt9_offset, ovt9_len, ovt7_offset, ovt7_len = struct.unpack_from(
+            "<8I", mapping, 0x40)
+        icon_banner_offset, = struct.unpack_from("<I", mapping, 0x68)
+        debug_rom_offset, debug_rom_len = struct.unpack_from("<II", mapping, 0x160)
+
+        end = max(0x200,
+                  arm9_offset + arm9_len + 0x100,  # small amount of data after arm9
+                  arm7_offset + arm7_len,
+                  fnt_offset + fnt_len,
+                  ovt9_offset + ovt9_len,
+                  ovt7_offset + ovt7_len,
+                  icon_banner_offset + 0x23C0 if icon_banner_offset else 0,  # largest icon banner
+                  debug_rom_offset + debug_rom_len if debug_rom_offset else 0)
+        image = bytearray(mapping[:min(end, len(mapping))])
+        struct.pack_into("<I", image, 0x4C, 0)  # FAT length, files are loaded from the map
+        return image
+
+    def _attach_mapping(self, mapping: mmap.mmap, path):
+        """
+        Points the ROM files to views over the mapping, using the FAT on the mapped file.
+        """
+        self._mapping = mapping
+        self._mapped_path = os.path.abspath(path)
+
+        fat_offset, fat_len = struct.unpack_from("<II", mapping, 0x48)
+        view = memoryview(mapping)
+        self.files = []
+        offset_to_id = {}
+        self._mapped_views = []
+        for i, (start_offset, end_offset) in enumerate(struct.iter_unpack("<II", mapping[fat_offset:
+                                                                                         fat_offset + fat_len])):
+            self.files.append(view[start_offset:end_offset])
+            self._mapped_views.append((self.files[-1], start_offset, end_offset))
+            offset_to_id[start_offset] = i
+        self.sortedFileIds = [offset_to_id[offset] for offset in sorted(offset_to_id)]
+
+        # The RSA signature is located at the end of the ROM, outside the header image.
+        rsa_offset = struct.unpack_from("<I", mapping, 0x1000)[0] if len(mapping) >= 0x1004 else 0
+        rom_size, = struct.unpack_from("<I", mapping, 0x80)
+        if not rsa_offset and len(mapping) > rom_size:
+            rsa_offset = rom_size
+        self.rsaSignature = mapping[rsa_offset:min(len(mapping), rsa_offset + 0x88)] if rsa_offset else b""
+
+    def saveToFile(self, filePath, in_place: bool = False, **kwargs):
+        """
+        Saves the ROM to a filesystem file.
+
+        Parameters
+        ----------
+        filePath : str
+            Path of the ROM file.
+        in_place : bool
+            If True and the file is the one the ROM was loaded from or last saved to, only the changed files, the
+            FAT, the FNT and the header are written to it. Changed files which don't fit in their old space are
+            moved to the end of the ROM. When the file can't be updated this way, the whole ROM is saved.
+        **kwargs
+            Arguments for ndspy's save.
+        """
+        if in_place and not kwargs and self._save_in_place(filePath):
+            return
+        data = self.save(**kwargs)
+        was_mapped = self._mapped_path is not None and os.path.abspath(filePath) == self._mapped_path
+        remap = self._release_mapping(filePath)
+        if was_mapped and not remap:
+            # The map couldn't be closed, replace the file instead of truncating it under the map
+            with open(filePath + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(filePath + ".tmp", filePath)
+        else:
+            with open(filePath, "wb") as f:
+                f.write(data)
+        if remap:
+            self._attach_mapping(self._map_file(filePath), filePath)
+        self._synced_path = os.path.abspath(filePath)
+
+    def _release_mapping(self, path) -> bool:
+        """
+        Releases the memory map of the ROM file if it's the file at the specified path, which is about to be
+        written. Returns whether it was released. If views over the map are still in use elsewhere, the files are
+        copied into memory instead and the ROM stops using the map, which isn't released.
+        """
+        if self._mapped_path is None or os.path.abspath(path) != self._mapped_path:
+            return False
+        ranges = {id(view): (start, end) for view, start, end in self._mapped_views}
+        mapped_files = [(file_id, ranges[id(file)]) for file_id, file in enumerate(self.files)
+                        if isinstance(file, memoryview) and id(file) in ranges]
+        for view, _start, _end in self._mapped_views:
+            view.release()
+        self._mapped_views = []
+        mapping, self._mapping, self._mapped_path = self._mapping, None, None
+        try:
+            mapping.close()
+        except BufferError:
+            # Views kept outside the ROM (such as slices of its files) still use the map, copy the files instead
+            logging.warning("ROM file memory map still in use, loading its files into memory")
+            for file_id, (start, end) in mapped_files:
+                self.files[file_id] = mapping[start:end]
+            return False
+        return True
+
+    def _save_in_place(self, path) -> bool:
+        """
+        Writes the changes since the last save to the ROM file they were loaded from or saved to.
+
+        Returns
+        -------
+        bool
+            False if the file couldn't be updated in place, in which case nothing was written.
+        """
+        path = os.path.abspath(path)
+        if path != self._synced_path or self._files_moved or not os.path.isfile(path):
+            return False
+
+        mapping = self._map_file(path)
+        try:
+            header = bytearray(mapping[:0x200])
+            disk_rom = ndspy.rom.NintendoDSRom(self._mapped_header_image(mapping))
+            fnt_offset, fnt_len, fat_offset, fat_len = struct.unpack_from("<4I", header, 0x40)
+            fat = [list(entry) for entry in struct.iter_unpack("<II", mapping[fat_offset:fat_offset + fat_len])]
+            old_fnt = mapping[fnt_offset:fnt_offset + fnt_len]
+        finally:
+            mapping.close()
+
+        # Everything but the files and the FNT has to be unchanged
+        if len(fat) != len(self.files):
+            return False
+        for name, value in vars(disk_rom).items():
+            if name not in ("files", "filenames", "sortedFileIds", "rsaSignature") and getattr(self, name) != value:
+                return False
+        fnt = ndspy.fnt.save(self.filenames)
+        if len(fnt) > (fat_offset - fnt_offset if fat_offset > fnt_offset else fnt_len):
+            return False
+
+        summary = self._save_archives()
+        summary.files_moved = 0
+
+        # Each file can use the space up to the next file or header structure, as long as no other file shares it.
+        rom_size, = struct.unpack_from("<I", header, 0x80)
+        boundaries = {offset for offset in struct.unpack_from("<I12xI12xI4xI4xI4xI", header, 0x20) +
+                      struct.unpack_from("<I", header, 0x68) + struct.unpack_from("<I", header, 0x160) if offset}
+        boundaries.add(rom_size)
+        shared_starts = set()
+        for start, end in fat:
+            if end > start:
+                if start in boundaries:
+                    shared_starts.add(start)
+                boundaries.add(start)
+        boundaries = sorted(boundaries)
+
+        writes = []
+        append_offset = max([rom_size] + [end for _start, end in fat])
+        for file_id in sorted(self.dirty_files):
+            if file_id >= len(self.files):
+                continue
+            data = bytes(self.files[file_id])
+            start, end = fat[file_id]
+            # Empty files can't use the space of a file starting at the same offset
+            next_boundary = (bisect.bisect_right if end > start else bisect.bisect_left)(boundaries, start)
+            if start in shared_starts and end > start or next_boundary == len(boundaries):
+                limit = start
+            else:
+                limit = boundaries[next_boundary]
+            if len(data) > limit - start:
+                # Moved to the end of the ROM
+                start = append_offset + (-append_offset % 0x200)
+                summary.files_moved += 1
+                append_offset = start + len(data)
+            writes.append((start, data + b"\xFF" * max(0, end - start - len(data))))
+            fat[file_id] = [start, start + len(data)]
+
+        if summary.files_moved:
+            # The RSA signature goes after the last file, and its offset is the used size of the ROM.
+            rsa_offset = append_offset + (-append_offset % 0x20)
+            writes.append((rsa_offset, bytes(self.rsaSignature)))
+            struct.pack_into("<I", header, 0x80, rsa_offset)
+            writes.append((0x1000, struct.pack("<I", rsa_offset)))
+            if len(self.pad200) >= 0xE04:  # ndspy loads the offset at 0x1000 as part of pad200
+                self.pad200 = self.pad200[:0xE00] + struct.pack("<I", rsa_offset) + self.pad200[0xE04:]
+        if fnt != old_fnt:
+            writes.append((fnt_offset, fnt + b"\xFF" * max(0, fnt_len - len(fnt))))
+            struct.pack_into("<I", header, 0x44, len(fnt))
+        writes.append((fat_offset, struct.pack(f"<{len(fat) * 2}I", *(offset for entry in fat for offset in entry))))
+        struct.pack_into("<H", header, 0x15E, crc16(header[:0x15E]))
+        writes.append((0, bytes(header)))
+
+        remap = self._release_mapping(path)
+        with open(path, "r+b") as f:
+            for offset, data in writes:
+                f.seek(offset)
+                f.write(data)
+        if remap:
+            self._attach_mapping(self._map_file(path), path)
+
+        summary.files_rewritten = len(self.dirty_files)
+        self._finish_save(summary)
+        self._synced_path = path
+        return True
 
     def get_archive(self, path):
         """
@@ -197,19 +1080,132 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
         """
         if not path[0] == "/":
             raise ValueError("Path should start with slash.")
-        if path not in self._loaded_archives:
+        self.archive_cache.max_size = conf.ARCHIVE_CACHE_SIZE
+        archive = self.archive_cache.get(path)
+        if archive is None:
             self._get_archive_call = True
-            self._loaded_archives[path] = PlzArchive(path, rom=self)
+            archive = PlzArchive(path, rom=self)
             self._get_archive_call = False
-        return self._loaded_archives[path]
+            self.archive_cache.put(path, archive)
+        return archive
 
     def save(self, *args, **kwargs):
-        # Save all archives before saving the ROM.
+        summary = self._save_archives()
+        summary.files_rewritten = len(self.dirty_files)
+
+        files = self.files
+        duplicates = self._duplicate_files() if conf.DEDUPLICATE_FILES else {}
+        if duplicates:
+            # Duplicate files are saved empty, and then pointed to the data of the original file in the FAT.
+            self.files = [b"" if file_id in duplicates else file for file_id, file in enumerate(files)]
+        try:
+            data = super(NintendoDSRom, self).save(*args, **kwargs)
+        finally:
+            self.files = files
+        if duplicates:
+            data = bytearray(data)
+            fat_offset, = struct.unpack_from("<I", data, 0x48)
+            for file_id, original_id in duplicates.items():
+                data[fat_offset + file_id * 8:fat_offset + file_id * 8 + 8] = \
+                    data[fat_offset + original_id * 8:fat_offset + original_id * 8 + 8]
+            data = bytes(data)
+            summary.files_deduplicated = len(duplicates)
+            summary.bytes_deduplicated = sum(len(files[file_id]) for file_id in duplicates)
+        self._finish_save(summary)
+        return data
+
+    def _save_archives(self) -> SaveSummary:
+        """
+        Saves all the modified archives into the ROM files, before saving the ROM. Archives which haven't been
+        modified keep their original compressed data.
+
+        Returns
+        -------
+        SaveSummary
+            Summary of the save, with the archives saved.
+        """
+        summary = SaveSummary()
+        dirty_archives = []
+        for arch in self.archive_cache.archives():
+            if not arch.is_dirty:
+                summary.archives_skipped += 1
+                continue
+            summary.archives_rewritten += 1
+            summary.archive_files_rewritten += len(arch.dirty_files)
+            dirty_archives.append(arch)
+
+        # Serialize the archives, and compress them in parallel (archives from get_archive are always compressed).
+        payloads = [arch.to_bytes() for arch in dirty_archives]
+        compressed_payloads = compress_many(payloads, BEST if conf.BEST_COMPRESSION else LZ10,
+                                            double_typed=[arch._last_compressed == 2 for arch in dirty_archives])
+
         self._get_archive_call = True
-        for arch in self._loaded_archives:
-            self._loaded_archives[arch].save()
+        for arch, data in zip(dirty_archives, compressed_payloads):
+            with self.open(arch._last_filename, "wb+") as f:
+                f.write(data)
+            arch.clear_dirty()
         self._get_archive_call = False
-        return super(NintendoDSRom, self).save(*args, **kwargs)
+        self.archive_cache.evict()  # the saved archives can be evicted now
+        summary.best_compression = take_best_compression_report()
+        return summary
+
+    def _finish_save(self, summary: SaveSummary):
+        self.clear_dirty()
+        self._files_moved = False
+        self._synced_path = None  # set again once written to a file
+        self.last_save_summary = summary
+        logging.info(f"Saved ROM: {summary}")
+
+    def mark_dirty(self, index: Optional[int] = None):
+        super().mark_dirty(index)
+        if index is not None:
+            self._file_versions[index] = self._file_versions.get(index, 0) + 1
+
+    def file_version(self, path: str) -> Optional[Tuple[int, int]]:
+        """
+        Gets the version of the file at the specified path, which changes every time the data of the file is written
+        or files are added to or removed from the ROM.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file.
+
+        Returns
+        -------
+        Optional[Tuple[int, int]]
+            The version of the file, or None if it doesn't exist.
+        """
+        file_id = self.file_index.id_of(path)
+        if file_id is None:
+            return None
+        return self._layout_version, self._file_versions.get(file_id, 0)
+
+    def _duplicate_files(self) -> Dict[int, int]:
+        """
+        Finds the files whose data is identical to the data of a file with a lower id.
+
+        Returns
+        -------
+        Dict[int, int]
+            Id of each duplicate file mapped to the id of the first file with the same data.
+        """
+        # Only files sharing their size with another file need to be hashed
+        ids_by_size: Dict[int, List[int]] = {}
+        for file_id, file in enumerate(self.files):
+            if len(file):
+                ids_by_size.setdefault(len(file), []).append(file_id)
+
+        duplicates = {}
+        for file_ids in ids_by_size.values():
+            if len(file_ids) < 2:
+                continue
+            first_ids: Dict[bytes, int] = {}
+            for file_id in file_ids:
+                original_id = first_ids.setdefault(hashlib.sha256(self.files[file_id]).digest(), file_id)
+                if original_id != file_id and self.files[file_id] == self.files[original_id]:
+                    duplicates[file_id] = original_id
+        return duplicates
 
     # TODO: Unify archive opening and make sure archive are opened only once
     def open(self, file: Union[AnyStr, int], mode: str = "rb") -> Union[io.BytesIO, io.TextIOWrapper]:
@@ -242,17 +1238,17 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
 
         if isinstance(file, int):
             fileid = file
-            file = self.filenames.filenameOf(file)
+            file = self.file_index.path_of(file) if self._batch is None else self._batch.path_of(file)
         else:
-            fileid = self.filenames.idOf(file)
-            if not fileid and create:
+            fileid = self.file_index.id_of(file) if self._batch is None else self._batch.file_id(file)
+            if fileid is None and create:
                 fileid = self.add_file(file)
-                if not fileid:
+                if fileid is None:
                     raise FileNotFoundError(f"file '{file}' could not be opened nor created")
-            if not fileid:
+            if fileid is None:
                 raise FileNotFoundError(f"file '{file}' could not be opened")
 
-        if file.lower().endswith(".plz") and not self._get_archive_call:
+        if file is not None and file.lower().endswith(".plz") and not self._get_archive_call:
             # Alert on the log of this action.
             logging.warning("PLZ archive not opened from get_archive!", stack_info=True)
 
@@ -261,16 +1257,42 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
             return io.TextIOWrapper(rom_file, encoding="cp1252")
         return rom_file
 
+    def batch(self) -> RomBatch:
+        """
+        Groups the files added, removed and moved inside a with block, so that the files are renumbered only once
+        for all of them when the block exits. Importing many files at once should be done inside a batch.
+
+        Files added in the batch can be opened by path, but they only appear in the file index and the filename
+        table once the batch exits.
+
+        Returns
+        -------
+        RomBatch
+            The batch, to use in a with statement. Nested batches are merged with the outermost one.
+        """
+        if self._batch is not None:
+            return self._batch
+        return RomBatch(self)
+
     def add_file(self, file: str) -> Optional[int]:
+        if self._batch is not None:
+            return self._batch.add_file(file)
         folder_name, filename = os.path.split(file)
-        folder_add = self.filenames[folder_name]
+        folder_add = self.file_index.folder(folder_name)
+        if folder_add is None:
+            return None
         new_file_id = folder_add.firstID + len(folder_add.files)
 
         # Insert our new file into this ID
         self.files.insert(new_file_id, b"")
+        self._shift_dirty_files(new_file_id, 1)
+        self.mark_dirty(new_file_id)
+        self._files_moved = True
+        self._layout_version += 1
 
         # Add our file to the folder
         folder_add.files.append(filename)
+        self.file_index.file_added(file, folder_add, len(folder_add.files) - 1)
 
         # Change the firstID of all the folders after our base folder.
         def increment_first_index_if_needed(new_id, root: Folder):
@@ -293,11 +1315,20 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
         return new_file_id
 
     def remove_file(self, file: str):
+        if self._batch is not None:
+            self._batch.remove_file(file)
+            return
         folder_name, filename = os.path.split(file)
-        folder: Folder = self.filenames[folder_name]
-        fileid = self.filenames.idOf(file)
+        folder: Folder = self.file_index.folder(folder_name)
+        fileid = self.file_index.id_of(file)
         folder.files.remove(filename)
+        self.file_index.file_removed(file)
         del self.files[fileid]
+        self._dirty_files.discard(fileid)
+        self._shift_dirty_files(fileid + 1, -1)
+        self.mark_dirty()
+        self._files_moved = True
+        self._layout_version += 1
 
         def decrement_first_index_if_needed(removed_id, root: Folder):
             if root.firstID > removed_id:
@@ -315,10 +1346,15 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
                 fp.close()
 
     def rename_file(self, path: str, new_filename: str):
+        if self._batch is not None and RomFileIndex.normalize(path) in self._batch.added:
+            self._batch.rename_file(path, new_filename)
+            return
         folder_name, filename = os.path.split(path)
-        folder: Folder = self.filenames[folder_name]
+        folder: Folder = self.file_index.folder(folder_name)
         index = folder.files.index(filename)
         folder.files[index] = new_filename
+        self.file_index.file_renamed(path, folder_name + "/" + new_filename)
+        self.mark_dirty()
 
     def move_file(self, old_path, new_path):
         """
@@ -349,8 +1385,7 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
     def folder_get_parent(self, path) -> Folder:
         *basedirs, subdir = self.folder_split(path)
         if basedirs:
-            base_path = "/".join(basedirs) + "/"
-            return self.filenames[base_path]
+            return self.file_index.folder("/".join(basedirs))
         else:  # The folder is located at the root.
             return self.filenames
 
@@ -358,9 +1393,11 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
         parent = self.folder_get_parent(path)
         new_folder = Folder(firstID=len(self.files))
         parent.folders.append((self.folder_split(path)[-1], new_folder))
+        self.file_index.folder_added(path, new_folder)
+        self.mark_dirty()
 
     def remove_folder(self, path):
-        folder = self.filenames[path]
+        folder = self.file_index.folder(path)
         if not folder:
             raise Exception(f"Directory {path} does not exist.")
         if folder.files or folder.folders:
@@ -369,9 +1406,11 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
         parent = self.folder_get_parent(path)
 
         parent.folders.remove((self.folder_split(path)[-1], folder))
+        self.file_index.folder_removed(path)
+        self.mark_dirty()
 
     def rename_folder(self, old_path, new_path):
-        folder = self.filenames[old_path]
+        folder = self.file_index.folder(old_path)
 
         # get parents
         old_parent = self.folder_get_parent(old_path)
@@ -387,6 +1426,8 @@ class NintendoDSRom(ndspy.rom.NintendoDSRom, Archive):
         else:  # same parent, keep the folder index
             index = old_parent.folders.index(old_folder_item)
             new_parent.folders[index] = new_folder_item
+        self.file_index.folder_renamed(old_path, new_path)
+        self.mark_dirty()
 
 
 class FileFormat:
@@ -405,6 +1446,13 @@ class FileFormat:
     - 2 - Double typed compressed file
     """
 
+    _lazy_decompression = False
+    """
+    Whether compressed files are decompressed only as far as they are read, instead of all at once.
+
+    Only worth it for formats which read a part of the file, as reading from a lazy file is slower.
+    """
+
     _last_compressed = _compressed_default
     """The compression last used when opening the file."""
     _last_filename: Optional[str] = None
@@ -421,7 +1469,7 @@ class FileFormat:
         if compressed is None:
             compressed = self._compressed_default
         if compressed:
-            file = CompressedIOWrapper(file, double_typed=(compressed == 2))
+            file = CompressedIOWrapper(file, double_typed=(compressed == 2), lazy=self._lazy_decompression)
         self._last_compressed = compressed
 
         if file is not None:
@@ -467,6 +1515,80 @@ class FileFormat:
         pass
 
 
+class PlzMemberList(MutableSequence):
+    """
+    Data of the files of a plz archive, sliced from the archive data only when accessed.
+
+    The position and size of each file are kept in arrays. Until a file is replaced, its entry is a read-only
+    view over the archive data, which a RomFile copies when opened. Replaced and added files are stored
+    as bytes, so the archive data is never modified (copy-on-write).
+    """
+    def __init__(self, source: memoryview = memoryview(b"")):
+        self._source = source
+        """The data of the archive."""
+        self._offsets = array("I")
+        """Position of each file in the archive data."""
+        self._sizes = array("I")
+        """Size of each file in the archive data."""
+        self._replaced: Dict[int, bytes] = {}
+        """Data of the files which have been replaced or added, by index."""
+
+    def add_member(self, offset: int, size: int):
+        """
+        Appends a file stored in the archive data.
+        """
+        self._offsets.append(offset)
+        self._sizes.append(size)
+
+    def _check_index(self, index: int) -> int:
+        if not isinstance(index, int):
+            raise TypeError(f"member indices must be integers, not {type(index).__name__}")
+        if index < 0:
+            index += len(self._offsets)
+        if not 0 <= index < len(self._offsets):
+            raise IndexError("member index out of range")
+        return index
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Union[bytes, memoryview]:
+        index = self._check_index(index)
+        if index in self._replaced:
+            return self._replaced[index]
+        offset = self._offsets[index]
+        return self._source[offset:offset + self._sizes[index]]
+
+    def __setitem__(self, index: int, value: bytes):
+        self._replaced[self._check_index(index)] = value
+
+    def __delitem__(self, index: int):
+        index = self._check_index(index)
+        del self._offsets[index]
+        del self._sizes[index]
+        self._replaced.pop(index, None)
+        self._replaced = {i - 1 if i > index else i: data for i, data in self._replaced.items()}
+
+    def insert(self, index: int, value: bytes):
+        index = max(0, min(index + len(self) if index < 0 else index, len(self)))
+        self._replaced = {i + 1 if i >= index else i: data for i, data in self._replaced.items()}
+        self._offsets.insert(index, 0)
+        self._sizes.insert(index, 0)
+        self._replaced[index] = value
+
+    @property
+    def nbytes(self) -> int:
+        """Size in bytes of the archive data, the replaced files and the tables."""
+        return (self._source.nbytes + sum(len(data) for data in self._replaced.values()) +
+                self._offsets.itemsize * len(self._offsets) * 2)
+
+    def is_replaced(self, index: int) -> bool:
+        """
+        Whether the file has been replaced or added, instead of being a view over the archive data.
+        """
+        return self._check_index(index) in self._replaced
+
+
 class PlzArchive(Archive, FileFormat):
     """
     A Plz Archive, a file containing other files within, so that they are compressed.
@@ -474,9 +1596,84 @@ class PlzArchive(Archive, FileFormat):
     _compressed_default = 1
 
     filenames: List[str] = []
-    """List of the names of the files present in the plz archive."""
-    files: List[bytes] = []
-    """List of the data of the files present in the plz archive."""
+    """
+    List of the names of the files present in the plz archive.
+
+    The list should only be modified through add_file, remove_file and rename_file, or replaced as a whole,
+    so that the name index stays up to date.
+    """
+    files: Union[List[bytes], PlzMemberList] = []
+    """
+    List of the data of the files present in the plz archive.
+
+    When the archive is read with conf.LAZY_PLZ_MEMBERS, this is a PlzMemberList, whose entries are views
+    over the archive data until they're replaced.
+    """
+
+    _indexed_filenames: Optional[List[str]] = None
+    """The filenames list the index was built from."""
+    _name_index: Dict[str, int] = {}
+    """Name of each file mapped to its index (the first one, if the name is repeated)."""
+    _sorted_filenames: List[str] = []
+    """Sorted list of the names of the files, used for prefix lookups."""
+
+    def _index(self) -> Dict[str, int]:
+        """
+        Gets the name index, building it again if the filenames list has been replaced.
+        """
+        if self._indexed_filenames is not self.filenames:
+            self._name_index = {}
+            for index, filename in enumerate(self.filenames):
+                self._name_index.setdefault(filename, index)
+            self._sorted_filenames = sorted(self.filenames)
+            self._indexed_filenames = self.filenames
+        return self._name_index
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._index()
+
+    def index_of(self, filename: str) -> Optional[int]:
+        """
+        Gets the index of the file with the specified name, or None if it doesn't exist.
+        """
+        return self._index().get(filename)
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        """
+        Gets the names of all files starting with the specified prefix, in the order of the archive.
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix, for example "m1_" for the subtitles of movie 1.
+        """
+        name_index = self._index()
+        start = bisect.bisect_left(self._sorted_filenames, prefix)
+        end = start
+        while end < len(self._sorted_filenames) and self._sorted_filenames[end].startswith(prefix):
+            end += 1
+        return sorted(self._sorted_filenames[start:end], key=name_index.__getitem__)
+
+    def glob(self, pattern: str) -> List[str]:
+        """
+        Gets the names of all files matching a shell-style pattern, in the order of the archive.
+
+        Parameters
+        ----------
+        pattern : str
+            The pattern, as understood by fnmatch (case-sensitive), for example "t10_*.gds". Only the names
+            starting with the literal part of the pattern are checked.
+        """
+        literal_end = re.search(r"[*?\[]|$", pattern).start()
+        return [filename for filename in self.with_prefix(pattern[:literal_end])
+                if fnmatch.fnmatchcase(filename, pattern)]
+
+    @property
+    def memory_size(self) -> int:
+        """Approximate size in bytes of the data of the files held by the archive."""
+        if isinstance(self.files, PlzMemberList):
+            return self.files.nbytes
+        return sum(len(file) for file in self.files)
 
     def read_stream(self, stream):
         if isinstance(stream, BinaryReader):
@@ -485,29 +1682,26 @@ class PlzArchive(Archive, FileFormat):
             rdr = BinaryReader(stream)
 
         self.filenames = []
-        self.files = []
+        lazy = conf.LAZY_PLZ_MEMBERS
+        # Only the headers are parsed, the files are views over the data
+        self.files = PlzMemberList(memoryview(rdr.getvalue())) if lazy else []
 
         header_size = rdr.read_uint32()
         archive_file_size = rdr.read_uint32()
         assert rdr.read(4) == b"PCK2"
-        rdr.seek(header_size)
-
-        while rdr.c < archive_file_size:
-            start_pos = rdr.c
-
-            file_header_size = rdr.read_uint32()
-            file_total_size = rdr.read_uint32()
-            rdr.seek(4, io.SEEK_CUR)
-            file_size = rdr.read_uint32()
+        start_pos = rdr.seek(header_size)
 
+        while start_pos < archive_file_size:
+            file_header_size, file_total_size, _, file_size = rdr.read_struct("4I")
             filename = rdr.read_string(encoding="shift-jis")
 
-            rdr.seek(start_pos + file_header_size)
-            file = rdr.read(file_size)
-            rdr.seek(start_pos + file_total_size)
-
             self.filenames.append(filename)
-            self.files.append(file)
+            if lazy:
+                self.files.add_member(start_pos + file_header_size, file_size)
+            else:
+                rdr.seek(start_pos + file_header_size)
+                self.files.append(rdr.read(file_size))
+            start_pos = rdr.seek(start_pos + file_total_size)
 
     def write_stream(self, stream):
         if isinstance(stream, BinaryWriter):
@@ -524,17 +1718,18 @@ class PlzArchive(Archive, FileFormat):
             header_size = 16 + len(self.filenames[i]) + 1
             header_size += 4 - header_size % 4
 
-            total_size = header_size + len(self.files[i])
+            file = self.files[i]  # files which haven't been replaced are written from the archive data
+            total_size = header_size + len(file)
             total_size += 4 - total_size % 4
             c = wtr.c
             wtr.write_uint32(header_size)
             wtr.write_uint32(total_size)
             wtr.write_uint32(0)
-            wtr.write_uint32(len(self.files[i]))
+            wtr.write_uint32(len(file))
 
             wtr.write_string(self.filenames[i])
             wtr.seek(c + header_size)
-            wtr.write(self.files[i])
+            wtr.write(file)
             # Seek while adding bytes
             while wtr.c != c + total_size:
                 wtr.write_uint8(0)
@@ -543,6 +1738,19 @@ class PlzArchive(Archive, FileFormat):
         wtr.seek(4)
         wtr.write_uint32(file_size)
 
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the archive as an uncompressed PCK2 container.
+
+        Returns
+        -------
+        bytes
+            The archive data.
+        """
+        wtr = BinaryWriter()
+        self.write_stream(wtr)
+        return wtr.getvalue()
+
     def open(self, file: Union[AnyStr, int], mode: str = "rb") -> Union[io.BytesIO, io.TextIOWrapper]:
         match = re.findall(r"^([rwa])(b?)(\+?)$", mode)
         if not match:
@@ -558,13 +1766,10 @@ class PlzArchive(Archive, FileFormat):
         if isinstance(file, int):
             fileid = file
         else:
-            try:
-                fileid = self.filenames.index(file)
-            except ValueError:
-                fileid = None
+            fileid = self.index_of(file)
             if fileid is None and create:
                 fileid = self.add_file(file)
-                if not fileid:
+                if fileid is None:
                     raise FileNotFoundError(f"file '{file}' could not be opened nor created")
             if fileid is None:
                 raise FileNotFoundError(f"file '{file}' could not be opened")
@@ -575,21 +1780,46 @@ class PlzArchive(Archive, FileFormat):
         return rom_file
 
     def add_file(self, filename: str):
+        name_index = self._index()
         new_file_id = len(self.files)
         self.files.append(b"")
         self.filenames.append(filename)
+        name_index.setdefault(filename, new_file_id)
+        bisect.insort(self._sorted_filenames, filename)
+        self.mark_dirty(new_file_id)
 
         return new_file_id
 
     def remove_file(self, filename: str):
-        if filename not in self.filenames:
+        index = self.index_of(filename)
+        if index is None:
             return
-        index = self.filenames.index(filename)
         self.files.pop(index)
         self.filenames.pop(index)
+        self._drop_name(filename)
+        # The files after the removed one move one index back
+        for moved_index in range(index, len(self.filenames)):
+            moved_filename = self.filenames[moved_index]
+            if self._name_index.get(moved_filename, moved_index) >= moved_index:
+                self._name_index[moved_filename] = moved_index
+        self._dirty_files.discard(index)
+        self._shift_dirty_files(index + 1, -1)
+        self.mark_dirty()
 
     def rename_file(self, old_filename, new_filename):
-        if old_filename not in self.filenames:
+        index = self.index_of(old_filename)
+        if index is None:
             return
-        index = self.filenames.index(old_filename)
         self.filenames[index] = new_filename
+        self._drop_name(old_filename)
+        position = bisect.bisect_left(self._sorted_filenames, old_filename)
+        if position < len(self._sorted_filenames) and self._sorted_filenames[position] == old_filename:
+            # The name was repeated, it now refers to its next file
+            self._name_index[old_filename] = self.filenames.index(old_filename, index + 1)
+        self._name_index[new_filename] = min(index, self._name_index.get(new_filename, index))
+        bisect.insort(self._sorted_filenames, new_filename)
+        self.mark_dirty()
+
+    def _drop_name(self, filename: str):
+        del self._name_index[filename]
+        del self._sorted_filenames[bisect.bisect_left(self._sorted_filenames, filename)]
@@ -100,4 +100,4 @@ class GDS(FileFormat):
                     wtr.write_string(p)
         wtr.write_uint16(0xc)
         wtr.seek(0)
-        wtr.write_uint32(len(wtr.data) - 4)
+        wtr.write_uint32(len(wtr) - 4)
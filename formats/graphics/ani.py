@@ -5,7 +5,6 @@ from math import floor, ceil, log
 from typing import *
 from typing import BinaryIO
 
-import ndspy.color
 import numpy as np
 from PIL.ImageQt import ImageQt
 from PySide6 import QtGui
@@ -13,6 +12,7 @@ from PIL import Image
 
 from formats.binary import BinaryReader, BinaryWriter, SEEK_CUR
 from formats.filesystem import FileFormat
+from formats.graphics.palette import pack_palette, unpack_palette
 
 
 # Calculate and write the sections
@@ -111,6 +111,37 @@ def generate_palette(images: List[Image.Image], maximum_color_count: int):
     return palette, images_numpy
 
 
+def unpack_4bit(data: np.ndarray) -> np.ndarray:
+    """
+    Splits each byte into two 4 bit pixels, the low nibble being the first pixel.
+    """
+    return np.stack((data & 0xf, data >> 4), axis=-1).reshape(-1)
+
+
+def pack_4bit(pixels: np.ndarray) -> np.ndarray:
+    """
+    Packs each two consecutive 4 bit pixels into a byte, the first pixel in the low nibble.
+    """
+    pixels = pixels.reshape((-1, 2))
+    return pixels[:, 0] & 0xf | pixels[:, 1] << 4
+
+
+def tiles_to_part(tiles: np.ndarray, part_h: int, part_w: int) -> np.ndarray:
+    """
+    Assembles a part stored as 8x8 tiles, in row order, into a (part_h, part_w) array.
+    """
+    # (tiles_h, tiles_w, 8, 8) -> (tiles_h, 8, tiles_w, 8) -> (part_h, part_w)
+    return tiles.reshape((part_h // 8, part_w // 8, 8, 8)).transpose((0, 2, 1, 3)).reshape((part_h, part_w))
+
+
+def part_to_tiles(part: np.ndarray) -> np.ndarray:
+    """
+    Splits a part into 8x8 tiles in row order, as an array of shape (tiles_h, tiles_w, 8, 8).
+    """
+    part_h, part_w = part.shape
+    return part.reshape((part_h // 8, 8, part_w // 8, 8)).transpose((0, 2, 1, 3))
+
+
 @dataclass
 class AnimationFrame:
     """
@@ -207,21 +238,14 @@ class AniSprite(FileFormat):
 
             rdr.seek(2, SEEK_CUR)
             for part_i in range(n_parts):
-                part_x = rdr.read_uint16()
-                part_y = rdr.read_uint16()
-                part_w = 2 ** (3 + rdr.read_uint16())
-                part_h = 2 ** (3 + rdr.read_uint16())
+                part_x, part_y, part_w, part_h = rdr.read_struct("4H")
+                part_w, part_h = 8 << part_w, 8 << part_h
 
                 part: np.ndarray
                 if self.color_depth == 8:
-                    part = np.frombuffer(rdr.read(part_h * part_w), np.uint8)
-                    part = part.reshape((part_h, part_w))
+                    part = rdr.read_array(np.uint8, part_h * part_w).reshape((part_h, part_w))
                 else:
-                    bufpart = np.frombuffer(rdr.read(part_h * part_w // 2), np.uint8)
-                    part = np.zeros((part_w * part_h), np.uint8)
-                    part[0::2] = bufpart & 0xf
-                    part[1::2] = bufpart >> 4
-                    part = part.reshape((part_h, part_w))
+                    part = unpack_4bit(rdr.read_array(np.uint8, part_h * part_w // 2)).reshape((part_h, part_w))
 
                 if (part_x + part_w) > img_w:
                     part_w = img_w - part_x
@@ -232,11 +256,8 @@ class AniSprite(FileFormat):
             self.images.append(img)
 
         palette_length = rdr.read_uint32()
-        self.palette = np.zeros((palette_length, 4), np.uint8)
-        for color_i in range(palette_length):
-            self.palette[color_i] = ndspy.color.unpack255(rdr.read_uint16())
-            if color_i:
-                self.palette[color_i, 3] = 255
+        self.palette = unpack_palette(rdr.read_array(np.uint16, palette_length))
+        self.palette[1:, 3] = 255
 
         rdr.seek(0x1E, SEEK_CUR)
         n_animations = rdr.read_uint32()
@@ -244,13 +265,11 @@ class AniSprite(FileFormat):
         animation_frame_sets = []
         for i in range(n_animations):
             n_frames = rdr.read_uint32()
-            frame_indexes = rdr.read_uint32_array(n_frames)
-            frame_durations = rdr.read_uint32_array(n_frames)
-            image_indexes = rdr.read_uint32_array(n_frames)
+            # Frame indexes, frame durations and image indexes, one table after the other
+            frame_table = rdr.read_array(np.uint32, n_frames * 3).reshape((3, n_frames)).T.tolist()
             animation_frame_sets.append([
-                AnimationFrame(next_frame_index=frame_indexes[i], duration=frame_durations[i],
-                               image_index=image_indexes[i])
-                for i in range(n_frames)])
+                AnimationFrame(next_frame_index=next_frame_index, duration=duration, image_index=image_index)
+                for next_frame_index, duration, image_index in frame_table])
         self.animations = [Animation(name=animation_names[i], frames=animation_frame_sets[i])
                            for i in range(n_animations)]
 
@@ -318,25 +337,13 @@ class AniSprite(FileFormat):
 
                     part[:part_h, :part_w] = img[part_y:part_y + part_h, part_x:part_x + part_w]
 
-                    if self.color_depth == 8:
-                        wtr.write(part.tobytes())
-                    else:
-                        h, w = part.shape
-                        bufpart = part.reshape((w * h))
-                        part_4bit = np.zeros((h * w // 2), np.uint8)
-                        part_4bit[:] = bufpart[0::2] & 0xf | bufpart[1::2] << 4
-                        wtr.write(part_4bit.tobytes())
+                    wtr.write_array(part if self.color_depth == 8 else pack_4bit(part))
 
                     part_x += part_w
                 part_y += part_h
 
         wtr.write_uint32(len(self.palette))
-        for color_i in range(len(self.palette)):
-            self.palette[color_i]: np.ndarray
-            self.palette[color_i, 3] = 0
-            wtr.write_uint16(ndspy.color.pack255(*self.palette[color_i]))
-            if color_i:
-                self.palette[color_i, 3] = 255
+        wtr.write_array(pack_palette(self.palette[:, :3]))
 
         wtr.write_zeros(0x1e)
         wtr.write_uint32(len(self.animations))
@@ -345,9 +352,9 @@ class AniSprite(FileFormat):
             wtr.write_string(anim.name, 0x1e)
         for anim in self.animations:
             wtr.write_uint32(len(anim.frames))
-            wtr.write_uint32_array([frame.next_frame_index for frame in anim.frames])
-            wtr.write_uint32_array([frame.duration for frame in anim.frames])
-            wtr.write_uint32_array([frame.image_index for frame in anim.frames])
+            wtr.write_array(np.array([[frame.next_frame_index for frame in anim.frames],
+                                      [frame.duration for frame in anim.frames],
+                                      [frame.image_index for frame in anim.frames]], np.uint32))
 
         wtr.write_uint16(0x1234)  # magic number probably
 
@@ -527,43 +534,21 @@ class AniSubSprite(AniSprite):
 
             rdr.seek(2, SEEK_CUR)
             for part_i in range(n_parts):
-                _part_glb_x = rdr.read_uint16()
-                _part_glb_y = rdr.read_uint16()
-                part_x = rdr.read_uint16()
-                part_y = rdr.read_uint16()
-                part_w = 2 ** (3 + rdr.read_uint16())
-                part_h = 2 ** (3 + rdr.read_uint16())
-                part: np.ndarray
+                _part_glb_x, _part_glb_y, part_x, part_y, part_w, part_h = rdr.read_struct("6H")
+                part_w, part_h = 8 << part_w, 8 << part_h
                 if self.color_depth == 8:
-                    part = np.frombuffer(rdr.read(part_h * part_w), np.uint8)
+                    tiles = rdr.read_array(np.uint8, part_h * part_w)
                 else:
-                    bufpart = np.frombuffer(rdr.read(part_h * part_w // 2), np.uint8)
-                    part = np.zeros((part_w * part_h), np.uint8)
-                    part[0::2] = bufpart & 0xf
-                    part[1::2] = bufpart >> 4
-                    part = part.reshape((part_h, part_w))
-                part.resize((part_h // 8, part_w // 8, 8, 8))
-                part_w = min(img_w - part_x, part_w)
-                part_h = min(img_h - part_y, part_h)
-                for yt, yslice in enumerate(part):
-                    for xt, xslice in enumerate(yslice):
-                        offset_y = part_y + yt * 8
-                        offset_x = part_x + xt * 8
-                        end_y = min(part_y + yt * 8 + 8, part_y + part_h)
-                        end_x = min(part_x + xt * 8 + 8, part_x + part_w)
-                        copy_h = max(end_y - offset_y, 0)
-                        copy_w = max(end_x - offset_x, 0)
-                        img[offset_y:end_y,
-                            offset_x:end_x] = \
-                            xslice[:copy_h, :copy_w]
+                    tiles = unpack_4bit(rdr.read_array(np.uint8, part_h * part_w // 2))
+                part = tiles_to_part(tiles, part_h, part_w)
+                copy_w = max(min(img_w - part_x, part_w), 0)
+                copy_h = max(min(img_h - part_y, part_h), 0)
+                img[part_y:part_y + copy_h, part_x:part_x + copy_w] = part[:copy_h, :copy_w]
 
             self.images.append(img)
 
-        self.palette = np.zeros((palette_length, 4), np.uint8)
-        for color_i in range(palette_length):
-            self.palette[color_i] = ndspy.color.unpack255(rdr.read_uint16())
-            if color_i:
-                self.palette[color_i, 3] = 255
+        self.palette = unpack_palette(rdr.read_array(np.uint16, palette_length))
+        self.palette[1:, 3] = 255
 
         rdr.seek(0x1E, SEEK_CUR)
         n_animations = rdr.read_uint32()
@@ -571,13 +556,11 @@ class AniSubSprite(AniSprite):
         animation_frame_sets = []
         for i in range(n_animations):
             n_frames = rdr.read_uint32()
-            frame_indexes = rdr.read_uint32_array(n_frames)
-            frame_durations = rdr.read_uint32_array(n_frames)
-            image_indexes = rdr.read_uint32_array(n_frames)
+            # Frame indexes, frame durations and image indexes, one table after the other
+            frame_table = rdr.read_array(np.uint32, n_frames * 3).reshape((3, n_frames)).T.tolist()
             animation_frame_sets.append([
-                AnimationFrame(next_frame_index=frame_indexes[i], duration=frame_durations[i],
-                               image_index=image_indexes[i])
-                for i in range(n_frames)])
+                AnimationFrame(next_frame_index=next_frame_index, duration=duration, image_index=image_index)
+                for next_frame_index, duration, image_index in frame_table])
         self.animations = [Animation(name=animation_names[i], frames=animation_frame_sets[i])
                            for i in range(n_animations)]
 
@@ -662,25 +645,13 @@ class AniSubSprite(AniSprite):
                 wtr.write_uint16(int(log(_part_w, 2)) - 3)
                 wtr.write_uint16(int(log(_part_h, 2)) - 3)
 
-                part = np.zeros((_part_h // 8, _part_w // 8, 8, 8), np.uint8)
-
-                if _part_x + _part_w > img_w:
-                    _part_w += img_w - _part_x - _part_w
-                if _part_y + _part_h > img_h:
-                    _part_h += img_h - _part_y - _part_h
-
-                for yt, yslice in enumerate(part):
-                    for xt, xslice in enumerate(yslice):
-                        xslice[:_part_h - 8 * yt, :_part_w - 8 * xt] = \
-                            img[_part_y + yt * 8:min(_part_y + yt * 8 + 8, _part_y + _part_h),
-                                _part_x + xt * 8:min(_part_x + xt * 8 + 8, _part_x + _part_w)]
+                part = np.zeros((_part_h, _part_w), np.uint8)
+                copy_w = min(img_w - _part_x, _part_w)
+                copy_h = min(img_h - _part_y, _part_h)
+                part[:copy_h, :copy_w] = img[_part_y:_part_y + copy_h, _part_x:_part_x + copy_w]
 
-                if self.color_depth == 8:
-                    wtr.write(part.tobytes())
-                else:
-                    _, hw = part.shape
-                    part_4bit: np.ndarray = part[:hw // 2] << 4 | part[hw // 2:]
-                    wtr.write(part_4bit.tobytes())
+                tiles = part_to_tiles(part)
+                wtr.write_array(tiles if self.color_depth == 8 else pack_4bit(np.ascontiguousarray(tiles)))
                 count += 1
 
             w_left, h_left = img_w, img_h
@@ -711,12 +682,7 @@ class AniSubSprite(AniSprite):
             wtr.write_uint16(count)
             wtr.seek(last_pos)
 
-        for color_i in range(len(self.palette)):
-            self.palette[color_i]: np.ndarray
-            self.palette[color_i, 3] = 0
-            wtr.write_uint16(ndspy.color.pack255(*self.palette[color_i]))
-            if color_i:
-                self.palette[color_i, 3] = 255
+        wtr.write_array(pack_palette(self.palette[:, :3]))
 
         wtr.write_zeros(0x1e)
         wtr.write_uint32(len(self.animations))
@@ -725,9 +691,9 @@ class AniSubSprite(AniSprite):
             wtr.write_string(anim.name, 0x1e)
         for anim in self.animations:
             wtr.write_uint32(len(anim.frames))
-            wtr.write_uint32_array([frame.next_frame_index for frame in anim.frames])
-            wtr.write_uint32_array([frame.duration for frame in anim.frames])
-            wtr.write_uint32_array([frame.image_index for frame in anim.frames])
+            wtr.write_array(np.array([[frame.next_frame_index for frame in anim.frames],
+                                      [frame.duration for frame in anim.frames],
+                                      [frame.image_index for frame in anim.frames]], np.uint32))
 
         wtr.write_uint16(0x1234)  # magic number probably
 
@@ -3,12 +3,12 @@ from typing import BinaryIO
 
 from formats.filesystem import FileFormat
 from formats.binary import BinaryReader, BinaryWriter
+from formats.graphics.palette import pack_palette, unpack_palette
 
 from PIL import Image
 from PIL.ImageQt import ImageQt
 from PySide6 import QtGui
 import numpy as np
-import ndspy.color
 
 
 class BGImage(FileFormat):
@@ -47,30 +47,19 @@ class BGImage(FileFormat):
         rdr.seek(0)
 
         palette_length = rdr.read_uint32()
-        self.palette = np.zeros((palette_length, 4), np.uint8)
-        for color_i in range(palette_length):
-            self.palette[color_i] = ndspy.color.unpack255(rdr.read_uint16())
-            if color_i:
-                self.palette[color_i, 3] = 255
+        self.palette = unpack_palette(rdr.read_array(np.uint16, palette_length))
+        self.palette[1:, 3] = 255
 
         n_tiles = rdr.read_uint32()
         # Read tiles and assemble image
-        tiles = np.frombuffer(rdr.read(n_tiles * 0x40), np.uint8).reshape((n_tiles, 8, 8))
+        tiles = rdr.read_array(np.uint8, n_tiles * 0x40).reshape((n_tiles, 8, 8))
 
         map_w = rdr.read_uint16()
         map_h = rdr.read_uint16()
+        tile_map = rdr.read_array(np.uint16, map_w * map_h).reshape((map_h, map_w))
 
-        img_w = map_w * 8
-        img_h = map_h * 8
-
-        self.image = np.zeros((img_h, img_w), np.uint8)
-
-        for map_y in range(map_h):
-            for map_x in range(map_w):
-                img_y = map_y * 8
-                img_x = map_x * 8
-
-                self.image[img_y:img_y + 8, img_x:img_x + 8] = tiles[rdr.read_uint16()]
+        # (map_h, map_w, 8, 8) -> (map_h, 8, map_w, 8) -> (img_h, img_w)
+        self.image = tiles[tile_map].transpose((0, 2, 1, 3)).reshape((map_h * 8, map_w * 8))
 
     def write_stream(self, stream):
         if isinstance(stream, BinaryWriter):
@@ -79,33 +68,25 @@ class BGImage(FileFormat):
             wtr = BinaryWriter(stream)
 
         wtr.write_uint32(len(self.palette))
-        for color_i in range(len(self.palette)):
-            self.palette[color_i]: np.ndarray
-            self.palette[color_i, 3] = 0
-            wtr.write_uint16(ndspy.color.pack255(*self.palette[color_i]))
-            self.palette[color_i, 3] = 255
+        wtr.write_array(pack_palette(self.palette[:, :3]))
 
         img_h, img_w = self.image.shape
         map_h, map_w = img_h // 8, img_w // 8
 
-        # Get all 8x8 unique tiles
-        tiles = np.asarray([self.image[y * 8:y * 8 + 8, x * 8:x * 8 + 8] for y in range(map_h) for x in range(map_w)])
-        _, idx = np.unique(tiles, return_index=True, axis=0)
-        tiles = tiles[np.sort(idx)]
-        wtr.write_uint32(len(tiles))
-        wtr.write(tiles.tobytes())
+        # Split the image in 8x8 tiles, (img_h, img_w) -> (map_h, 8, map_w, 8) -> (map_h, map_w, 8, 8)
+        tiles = np.ascontiguousarray(self.image[:map_h * 8, :map_w * 8].astype(np.uint8, copy=False)
+                                     .reshape((map_h, 8, map_w, 8)).transpose((0, 2, 1, 3)))
+        tile_data = tiles.tobytes()
+
+        # Unique tiles are numbered in order of appearance
+        tile_ids = {}
+        tile_map = [tile_ids.setdefault(tile_data[i:i + 0x40], len(tile_ids)) for i in range(0, len(tile_data), 0x40)]
+        wtr.write_uint32(len(tile_ids))
+        wtr.write(b"".join(tile_ids))
 
         wtr.write_uint16(map_w)
         wtr.write_uint16(map_h)
-
-        for y in range(map_h):
-            for x in range(map_w):
-                # Get tile and write the index of the tile
-                tile = self.image[y * 8:y * 8 + 8, x * 8:x * 8 + 8]
-
-                # Get tile id (numpy magic lol)
-                tile_id = np.where(np.all(tile.reshape((64,)) == tiles.reshape(tiles.shape[0], 64), axis=1) == True)
-                wtr.write_uint16(tile_id[0][0])
+        wtr.write_array(np.array(tile_map, np.uint16))
 
     def extract_image_qt(self) -> QtGui.QPixmap:
         """
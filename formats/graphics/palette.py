@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def unpack_palette(colors: np.ndarray) -> np.ndarray:
+    """
+    Converts NDS colors to RGBA.
+
+    Parameters
+    ----------
+    colors : np.ndarray
+        Array of 16 bit colors, with 5 bits per channel in BGR order and the alpha bit on the most significant bit.
+
+    Returns
+    -------
+    np.ndarray
+        New (len(colors), 4) uint8 array of RGBA colors, with alpha 255 for the colors with the alpha bit set and 0
+        for the rest. Each channel is expanded to 8 bits as ndspy.color.unpack255 does.
+    """
+    colors = np.asarray(colors, np.uint16).reshape(-1)
+    palette = np.empty((len(colors), 4), np.uint8)
+    for channel in range(3):
+        value = (colors >> (channel * 5)) & 0x1F
+        palette[:, channel] = (value << 3) | (value >> 2)
+    palette[:, 3] = np.where(colors & 0x8000, 255, 0)
+    return palette
+
+
+def pack_palette(palette: np.ndarray) -> np.ndarray:
+    """
+    Converts RGB or RGBA colors to NDS colors. The palette isn't modified.
+
+    Parameters
+    ----------
+    palette : np.ndarray
+        Array of shape (n, 3) or (n, 4) of 8 bit colors. With an alpha channel, the alpha bit is set for the colors
+        with alpha 128 or more, otherwise it's never set.
+
+    Returns
+    -------
+    np.ndarray
+        Array of n uint16 colors, rounded to 5 bits per channel as ndspy.color.pack255 does.
+    """
+    palette = np.asarray(palette).astype(np.int32)
+    colors = np.zeros(len(palette), np.int32)
+    for channel in range(3):
+        colors |= (((palette[:, channel] + 4) << 2) // 33 & 0x1F) << (channel * 5)
+    if palette.shape[1] > 3:
+        colors |= (palette[:, 3] >= 128) << 15
+    return colors.astype(np.uint16)
@@ -27,7 +27,7 @@ class Movie:
         movie_plz_file = self.rom.get_archive(f"/data_lt2/script/movie/{self.rom.lang}/movie.plz")
         gds_filename = f"m{self.movie_id}.gds"
 
-        if gds_filename not in movie_plz_file.filenames:
+        if gds_filename not in movie_plz_file:
             logging.error(f"GDS for movie {self.movie_id} not found")
             self.gds = formats.gds.GDS()
             return
@@ -42,7 +42,7 @@ class Movie:
     def _load_subtitles(self):
         subtitle_plz = self.rom.get_archive(f"/data_lt2/txt/{self.rom.lang}/txt.plz")
         self.subtitles = {}
-        for filename in subtitle_plz.filenames:
+        for filename in subtitle_plz.with_prefix(f"m{self.movie_id}_"):
             if match := re.match(f"m{self.movie_id}_([0-9]+)\\.txt", filename):
                 subtitle_id = int(match.group(1))
                 with subtitle_plz.open(filename, "rb") as subtitle_file:
@@ -51,7 +51,7 @@ class Movie:
     def _save_subtitles(self):
         subtitle_plz = self.rom.get_archive(f"/data_lt2/txt/{self.rom.lang}/txt.plz")
 
-        for filename in subtitle_plz.filenames.copy():
+        for filename in subtitle_plz.with_prefix(f"m{self.movie_id}_"):
             if re.match(f"m{self.movie_id}_[0-9]+\\.txt", filename):
                 subtitle_plz.remove_file(filename)
 
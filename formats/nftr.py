@@ -485,7 +485,7 @@ class NFTR(FileFormat):
         write_pos_seek_back(file_size_pos)
 
         # Match file size after alignment
-        if len(wtr.getvalue()) != wtr.tell():
+        if len(wtr) != wtr.tell():
             wtr.seek(wtr.tell() - 1)
             wtr.write(b"\0")
 
@@ -110,24 +110,11 @@ class Puzzle:
         self.bg_location_id = rdr.read_uint8()
         self.reward_id = rdr.read_uint8()
 
-        puzzle_text_offset = 0x70 + rdr.read_uint32()
-        puzzle_correct_answer_offset = 0x70 + rdr.read_uint32()
-        puzzle_incorrect_answer_offset = 0x70 + rdr.read_uint32()
-        puzzle_hint1_offset = 0x70 + rdr.read_uint32()
-        puzzle_hint2_offset = 0x70 + rdr.read_uint32()
-        puzzle_hint3_offset = 0x70 + rdr.read_uint32()
-        rdr.seek(puzzle_text_offset)
-        self.text = subs.replace_substitutions(rdr.read_string(encoding=self.encoding), True)
-        rdr.seek(puzzle_correct_answer_offset)
-        self.correct_answer = subs.replace_substitutions(rdr.read_string(encoding=self.encoding), True)
-        rdr.seek(puzzle_incorrect_answer_offset)
-        self.incorrect_answer = subs.replace_substitutions(rdr.read_string(encoding=self.encoding), True)
-        rdr.seek(puzzle_hint1_offset)
-        self.hint1 = subs.replace_substitutions(rdr.read_string(encoding=self.encoding), True)
-        rdr.seek(puzzle_hint2_offset)
-        self.hint2 = subs.replace_substitutions(rdr.read_string(encoding=self.encoding), True)
-        rdr.seek(puzzle_hint3_offset)
-        self.hint3 = subs.replace_substitutions(rdr.read_string(encoding=self.encoding), True)
+        # Offsets of the text, the correct and incorrect answers and the three hints
+        text_offsets = [0x70 + offset for offset in rdr.read_uint32_array(6)]
+        texts = [subs.replace_substitutions(text, True)
+                 for text in rdr.read_cstrings(text_offsets, encoding=self.encoding)]
+        self.text, self.correct_answer, self.incorrect_answer, self.hint1, self.hint2, self.hint3 = texts
 
     def export_data(self, wtr):
         if not isinstance(wtr, BinaryWriter):
@@ -174,7 +161,8 @@ class Puzzle:
         wtr.write_uint32(puzzle_hint2_offset)
         wtr.write_uint32(puzzle_hint3_offset)
         wtr.write(b"\x00" * 4 * 6)
-        wtr.write(puzzle_text_section.data)
+        with puzzle_text_section.getbuffer() as puzzle_text:
+            wtr.write(puzzle_text)
 
         return wtr
 
@@ -184,7 +172,7 @@ class Puzzle:
             bank = 3
 
         plz: formats.filesystem.PlzArchive = rom.get_archive(f"/data_lt2/nazo/{self.rom.lang}/nazo{bank}.plz")
-        if f"n{self.internal_id}.dat" not in plz.filenames:
+        if f"n{self.internal_id}.dat" not in plz:
             logging.error(f"Nazo dat not found (internal id {self.internal_id})")
             return None
 
@@ -229,7 +217,7 @@ class Puzzle:
 
         gds_filename = f"q{self.internal_id}_param.gds"
 
-        if gds_filename not in gds_plz_file.filenames:
+        if gds_filename not in gds_plz_file:
             logging.error(f"GDS for puzzle {self.internal_id} not found")
             return
 
@@ -163,10 +163,9 @@ class SADL(FileFormat):
         wtr.write_uint8(self.volume_maybe)
 
         wtr.seek(0x100)
-        buffer = self.buffer.copy()
-        buffer = buffer.reshape((buffer.shape[0], buffer.shape[1] // 0x10, 0x10))
-        buffer = buffer.swapaxes(0, 1)
-        wtr.write(buffer.tobytes())
+        # Interleave the channels in blocks of 0x10 bytes, copying the buffer once
+        buffer = self.buffer.reshape((self.buffer.shape[0], self.buffer.shape[1] // 0x10, 0x10))
+        wtr.write_array(buffer.swapaxes(0, 1))
 
         size = wtr.tell()
         wtr.seek(0x08)
@@ -85,7 +85,7 @@ class MainEditor(MainEditorUI):
         if file_path == "":
             return
 
-        rom = NintendoDSRom.fromFile(file_path)
+        rom = NintendoDSRom.fromFile(file_path, mapped=True)
 
         # Load language from arm9
         if rom.name == b"LAYTON2":
@@ -117,7 +117,7 @@ class MainEditor(MainEditorUI):
         if not self.overwrite_data_dialogue():
             return
         if self.last_path:
-            self.rom.saveToFile(self.last_path)
+            self.rom.saveToFile(self.last_path, in_place=True)
 
     def file_menu_save_as(self):
         file_path = SettingsManager().save_rom(self)
@@ -3,7 +3,6 @@ from typing import List, Dict
 
 from PySide6 import QtCore
 from ..EditorTypes import EditorCategory, EditorObject
-from formats.filesystem import Folder
 from formats.event import Event
 from formats.dlz import EventLchDlz
 from formats import conf
@@ -65,13 +64,12 @@ class EventCategory(EditorCategory):
         return self._event_top_nodes
 
     def generate_event_nodes(self):
-        event_folder: Folder = self.rom.filenames["/data_lt2/event"]
-        for filename in event_folder.files:
-            filename: str
-            if not re.match("ev_d[0-9abc]+.plz", filename):
+        for path in self.rom.file_index.with_prefix("data_lt2/event/ev_d"):
+            path: str
+            if not re.fullmatch("data_lt2/event/ev_d[0-9abc]+.plz", path):
                 continue
-            archive = self.rom.get_archive(f"/data_lt2/event/{filename}")
-            for filename_ in archive.filenames:
+            archive = self.rom.get_archive(f"/{path}")
+            for filename_ in archive.glob("e*_*.gds"):
                 if match := re.match("e([0-9]+)_([0-9]+).gds", filename_):
                     top = int(match.group(1))
                     btm = int(match.group(2))
@@ -1,8 +1,15 @@
+import io
 import logging
 import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import *
 
 import k4pg
 from formats import conf
+from formats.compression import decompress
 from k4pg import Sprite
 from k4pg.sprite.Sprite import Frame, Tag
 import pygame as pg
@@ -14,6 +21,104 @@ import numpy as np
 from utility.path import set_extension
 
 
+class SpriteCache:
+    """
+    Cache of the sprites and backgrounds (or the fonts) decoded from ROMs, shared by all the ROM loaders.
+
+    Each entry holds what is passed to the sprites (surface, frames, tags, variables and color key) or to the texts
+    (tileset and character maps), keyed by the ROM and the path, along with the version of the file it was decoded
+    from. Entries of files which have been written
+    since are dropped when looked up. Entries are evicted in least recently used order when the total size of their
+    surfaces exceeds max_size. The cache can be used from several threads at once.
+    """
+    def __init__(self, max_size: int):
+        """
+        Parameters
+        ----------
+        max_size : int
+            Maximum size in bytes of the surfaces of all the entries together.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        """Number of lookups which found an entry."""
+        self.misses = 0
+        """Number of lookups which didn't find an up to date entry."""
+
+        self._entries: OrderedDict[Tuple[int, str], tuple] = OrderedDict()
+        """Entries by ROM id and path, as the ROM reference, file version, sprite data and size, ordered from least
+        to most recently used."""
+        self.size = 0
+        """Total size of the surfaces in bytes."""
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, rom: NintendoDSRom, path: str) -> Optional[tuple]:
+        """
+        Gets the sprite data decoded from the path in the ROM, or None if it isn't cached or the file has changed.
+        """
+        key = (id(rom), path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                rom_ref, version, data, _size = entry
+                if rom_ref() is rom and version == rom.file_version(path):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, rom: NintendoDSRom, path: str, data: tuple, version: Optional[tuple] = None):
+        """
+        Adds the sprite data decoded from the path in the ROM, evicting the least recently used entries if needed.
+
+        Parameters
+        ----------
+        rom : NintendoDSRom
+            The ROM the data was read from.
+        path : str
+            The path of the file in the ROM.
+        data : tuple
+            The decoded sprite data.
+        version : tuple
+            The version of the file when it was read, as returned by NintendoDSRom.file_version. By default the
+            current version of the file.
+        """
+        key = (id(rom), path)
+        if version is None:
+            version = rom.file_version(path)
+        surf: pg.Surface = data[0]
+        size = surf.get_width() * surf.get_height() * surf.get_bytesize()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (weakref.ref(rom), version, data, size)
+            self.size += size
+            while self.size > self.max_size and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: Tuple[int, str]):
+        self.size -= self._entries.pop(key)[3]
+
+
+sprite_cache = SpriteCache(conf.SPRITE_CACHE_SIZE)
+"""Cache of the decoded sprites used by SpriteLoaderROM."""
+
+font_cache = SpriteCache(conf.SPRITE_CACHE_SIZE)
+"""Cache of the decoded fonts used by FontLoaderROM."""
+
+prefetch_executor = ThreadPoolExecutor(conf.PREFETCH_WORKERS, thread_name_prefix="SpritePrefetch")
+"""Worker pool decoding the sprites and fonts requested with SpriteLoaderROM.prefetch and FontLoaderROM.prefetch."""
+
+
 class SpriteLoaderROM(k4pg.SpriteLoaderOS):
     def __init__(self, rom: NintendoDSRom, base_path_rom=None, base_path_os=None):
         super(SpriteLoaderROM, self).__init__(base_path_os=base_path_os)
@@ -22,6 +127,54 @@ class SpriteLoaderROM(k4pg.SpriteLoaderOS):
 
     def load(self, path: str, sprite: Sprite, sprite_sheet=True, convert_alpha=False, do_copy=False):
         # sprite_sheet and convert_alpha are ignored
+        path, sprite_sheet = self._rom_path(path)
+        if path not in self.rom.file_index:
+            logging.warning(f"Path {path} not found for loading sprite")
+            super().load(path + ".png", sprite, sprite_sheet=sprite_sheet, convert_alpha=convert_alpha,
+                         do_copy=do_copy)
+            return
+
+        surf, frames, tags, vars_, color_key = self._get(path, sprite_sheet)
+        if do_copy:
+            surf, frames, tags = surf.copy(), frames.copy(), tags.copy()
+        sprite.load_sprite(self, surf, frames, tags, vars_=dict(vars_))
+        sprite.color_key = color_key
+
+    def prefetch(self, path: str) -> Optional[Future]:
+        """
+        Starts decoding a sprite or a background in the background, so that loading it later is immediate.
+
+        The file is read from the ROM on the calling thread, the workers only decompress and decode its data and
+        don't access the ROM.
+
+        Parameters
+        ----------
+        path : str
+            Path of the sprite, as passed to load.
+
+        Returns
+        -------
+        Optional[Future]
+            Future resolving to the decoded sprite data (surface, frames, tags, variables and color key), or None if
+            the path isn't in the ROM. The data is shared with the cache and shouldn't be modified.
+        """
+        path, sprite_sheet = self._rom_path(path)
+        if path not in self.rom.file_index:
+            return None
+        sprite_cache.max_size = conf.SPRITE_CACHE_SIZE
+        cached = sprite_cache.get(self.rom, path)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        version = self.rom.file_version(path)
+        data = self._read(path)
+        return prefetch_executor.submit(self._decode_to_cache, path, data, sprite_sheet, version)
+
+    def _rom_path(self, path: str) -> Tuple[str, bool]:
+        """
+        Gets the path of a sprite in the ROM and whether it is a sprite sheet.
+        """
         if self._base_path_rom is not None:
             path = os.path.join(self._base_path_rom, path).replace("\\", "/")
         sprite_sheet = path.startswith("data_lt2/ani")
@@ -30,19 +183,43 @@ class SpriteLoaderROM(k4pg.SpriteLoaderOS):
             path = set_extension(path, ".arj")
         else:
             path = set_extension(path, ".arc")
-        if path not in self.rom.filenames:
-            logging.warning(f"Path {path} not found for loading sprite")
-            super().load(path + ".png", sprite, sprite_sheet=sprite_sheet, convert_alpha=convert_alpha,
-                         do_copy=do_copy)
-            return
+        return path, sprite_sheet
+
+    def _get(self, path: str, sprite_sheet: bool) -> tuple:
+        sprite_cache.max_size = conf.SPRITE_CACHE_SIZE
+        cached = sprite_cache.get(self.rom, path)
+        if cached is None:
+            cached = self._decode(path, self._read(path), sprite_sheet)
+            sprite_cache.put(self.rom, path, cached)
+        return cached
+
+    def _read(self, path: str) -> bytes:
+        with self.rom.open(path, "rb") as file:
+            return file.read()
+
+    def _decode_to_cache(self, path: str, data: bytes, sprite_sheet: bool, version: Optional[tuple]) -> tuple:
+        decoded = self._decode(path, data, sprite_sheet)
+        sprite_cache.put(self.rom, path, decoded, version)
+        return decoded
+
+    def _decode(self, path: str, data: bytes, sprite_sheet: bool) -> tuple:
+        """
+        Decodes a sprite or a background from its compressed data. The ROM isn't accessed.
+
+        Returns
+        -------
+        tuple
+            The surface, frames, tags, variables and color key of the sprite.
+        """
+        data = decompress(data, True)[0]
         frames = []
         tags = []
         vars_ = {}
         if sprite_sheet:
             if path.endswith(".arj"):
-                ani_sprite = AniSubSprite(path, rom=self.rom)
+                ani_sprite = AniSubSprite(file=io.BytesIO(data), compressed=0)
             else:
-                ani_sprite = AniSprite(path, rom=self.rom)
+                ani_sprite = AniSprite(file=io.BytesIO(data), compressed=0)
             w, h = 0, 0
             for img in ani_sprite.images:
                 img_h, img_w = img.shape
@@ -74,13 +251,12 @@ class SpriteLoaderROM(k4pg.SpriteLoaderOS):
             vars_["child_image"] = ani_sprite.child_image
             color_key = pg.Color(0, 255, 0)
         else:
-            bg_sprite = BGImage(path, rom=self.rom)
+            bg_sprite = BGImage(file=io.BytesIO(data), compressed=0)
             img_array = bg_sprite.palette[bg_sprite.image][:, :, :-1]
             img_array = np.swapaxes(img_array, 0, 1)
             surf = pg.surfarray.make_surface(img_array)
             color_key = None
-        sprite.load_sprite(self, surf, frames, tags, vars_=vars_)
-        sprite.color_key = color_key
+        return surf, frames, tags, vars_, color_key
 
 
 class FontLoaderROM(k4pg.FontLoaderOS):
@@ -90,16 +266,90 @@ class FontLoaderROM(k4pg.FontLoaderOS):
         self.base_path_rom = base_path_rom
 
     def load(self, path: str, size: int, text: k4pg.FontSupportive):
+        rom_path = self._rom_path(path)
+        if rom_path not in self.rom.file_index:
+            super().load(path, size, text)
+            return
+
+        font_cache.max_size = conf.SPRITE_CACHE_SIZE
+        cached = font_cache.get(self.rom, rom_path)
+        if cached is None:
+            with self.rom.open(rom_path, "rb") as file:
+                cached = self._decode(file.read())
+            font_cache.put(self.rom, rom_path, cached)
+        tileset, encoding, char_map, tile_w, tile_h = cached
+
+        current_color = pg.Color(0, 0, 0)
+        mask_color = pg.Color(255, 255, 255)
+
+        color_commands = {
+            "r": pg.Color(255, 0, 0),
+            "x": pg.Color(0, 0, 0),
+            "w": pg.Color(255, 255, 255),
+            "g": pg.Color(0, 255, 0)
+        }
+
+        # The font map recolors its tileset in place, so each text gets its own copy
+        text.set_font(k4pg.FontMap(
+            tileset.copy(), 16, encoding, char_map,
+            current_color, mask_color, tile_w, tile_h,
+            0, 1, color_commands
+        ))
+
+    def prefetch(self, path: str) -> Optional[Future]:
+        """
+        Starts decoding a font in the background, so that loading it later is immediate.
+
+        The file is read from the ROM on the calling thread, the workers only decode its data.
+
+        Parameters
+        ----------
+        path : str
+            Path of the font, as passed to load.
+
+        Returns
+        -------
+        Optional[Future]
+            Future resolving to the decoded font (tileset, encoding, character map and tile size), or None if the
+            path isn't in the ROM.
+        """
+        rom_path = self._rom_path(path)
+        if rom_path not in self.rom.file_index:
+            return None
+        font_cache.max_size = conf.SPRITE_CACHE_SIZE
+        cached = font_cache.get(self.rom, rom_path)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        version = self.rom.file_version(rom_path)
+        with self.rom.open(rom_path, "rb") as file:
+            data = file.read()
+        return prefetch_executor.submit(self._decode_to_cache, rom_path, data, version)
+
+    def _rom_path(self, path: str) -> str:
         rom_path = path
         if self.base_path_rom is not None:
             rom_path = os.path.join(self.base_path_rom, path).replace("\\", "/")
         rom_path = rom_path.replace("?", self.rom.lang)
-        rom_path = set_extension(rom_path, ".NFTR")
-        if rom_path not in self.rom.filenames:
-            super().load(path, size, text)
-            return
+        return set_extension(rom_path, ".NFTR")
+
+    def _decode_to_cache(self, rom_path: str, data: bytes, version: Optional[tuple]) -> tuple:
+        decoded = self._decode(data)
+        font_cache.put(self.rom, rom_path, decoded, version=version)
+        return decoded
+
+    @staticmethod
+    def _decode(data: bytes) -> tuple:
+        """
+        Decodes a font from its data. The ROM isn't accessed.
 
-        nftr_file = NFTR(filename=rom_path, rom=self.rom)
+        Returns
+        -------
+        tuple
+            The tileset surface, the encoding, the character map and the width and height of the tiles.
+        """
+        nftr_file = NFTR(file=io.BytesIO(data))
         tile_count = len(nftr_file.char_glyph.tile_bitmaps)
         tileset_width = (min(16, tile_count)) * nftr_file.char_glyph.tile_width
         tileset_height = ((tile_count + 15) // 16) * nftr_file.char_glyph.tile_height
@@ -117,8 +367,6 @@ class FontLoaderROM(k4pg.FontLoaderOS):
             tile_y = i // 16
             tileset.blit(tile_surf, (tile_x*tile_w, tile_y*tile_h))
 
-        current_color = pg.Color(0, 0, 0)
-        mask_color = pg.Color(255, 255, 255)
         encoding = nftr_file.get_encoding_str()
 
         char_map = {}
@@ -139,16 +387,4 @@ class FontLoaderROM(k4pg.FontLoaderOS):
                     left_spacing[tile],
                     total_width_
                 )
-
-        color_commands = {
-            "r": pg.Color(255, 0, 0),
-            "x": pg.Color(0, 0, 0),
-            "w": pg.Color(255, 255, 255),
-            "g": pg.Color(0, 255, 0)
-        }
-
-        text.set_font(k4pg.FontMap(
-            tileset, 16, encoding, char_map,
-            current_color, mask_color, tile_w, tile_h,
-            0, 1, color_commands
-        ))
+        return tileset, encoding, char_map, tile_w, tile_h
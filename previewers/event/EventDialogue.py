@@ -2,7 +2,6 @@ import k4pg
 from .EventCharacter import EventCharacter
 import pygame as pg
 import pg_utils.sound.SADLStreamPlayer
-from pg_utils.rom.rom_extract import load_sadl
 from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
@@ -88,7 +87,8 @@ class EventDialogue(k4pg.Sprite):
         # If there is a voice line play it (first we stop it)
         if self.voice_line != -1:
             # USA workaround
-            sfx = load_sadl(f"data_lt2/stream/event/?/{str(self.voice_line).zfill(3)}_{self.current_pause}.SAD")
+            sfx = self.event_player.prefetcher.load_sadl(
+                f"data_lt2/stream/event/?/{str(self.voice_line).zfill(3)}_{self.current_pause}.SAD")
             if sfx is not None:
                 self.voice_player.load_sound(sfx)
                 self.voice_player.play()
@@ -161,7 +161,8 @@ class EventDialogue(k4pg.Sprite):
         elif self.text_left_to_do.startswith("@s"):
             self.text_left_to_do = self.text_left_to_do[2:]
             if self.dialogue_sfx_id != -1:
-                sadl = load_sadl(f"data_lt2/stream/ST_{str(self.dialogue_sfx_id).zfill(3)}.SAD")
+                sadl = self.event_player.prefetcher.load_sadl(
+                    f"data_lt2/stream/ST_{str(self.dialogue_sfx_id).zfill(3)}.SAD")
                 if sadl is not None:
                     self.dialogue_sfx_player.load_sound(sadl)
                     self.dialogue_sfx_player.play()
@@ -10,6 +10,7 @@ from .EventBG import EventBG
 from .EventSound import EventSound
 from .EventWaiter import EventWaiter
 from .EventDialogue import EventDialogue
+from .EventPrefetch import EventPrefetcher
 from pg_utils.rom.RomSingleton import RomSingleton
 from pg_utils.TwoScreenRenderer import TwoScreenRenderer
 
@@ -25,22 +26,36 @@ class EventPlayer(TwoScreenRenderer):
         self.sprite_loader = RomSingleton().get_sprite_loader()
         self.font_loader = RomSingleton().get_font_loader()
 
+        # Read the assets now and decode them in the background, the player starts once the first frame is decoded
+        self.prefetcher = EventPrefetcher(self.event, self.sprite_loader, self.font_loader)
+        self.prefetcher.start()
+        self.started = False
+
         self.top_bg = EventBG("top")
+        self.btm_bg = EventBG("btm")
+
+        self.waiter = EventWaiter()
+        self.event_sound = EventSound(self.prefetcher)
+
+        self.characters: List[Optional[EventCharacter]] = [None]*8
+
+        self.dialogue = EventDialogue(self, position=pg.Vector2(0, 192//2 + 3),
+                                      center=pg.Vector2(k4pg.Alignment.CENTER, k4pg.Alignment.BOTTOM))
+
+        self.inp = k4pg.Input()
+
+        # self.run_events_until_busy()
+
+    def _start(self):
         self.sprite_loader.load(f"data_lt2/bg/event/sub{self.event.map_top_id}.arc", self.top_bg.bg,
                                 sprite_sheet=False)
         self.top_bg.fade(2, None, True)
         self.top_bg.set_tint([0, 0, 0, 0])
-        self.btm_bg = EventBG("btm")
         self.sprite_loader.load(f"data_lt2/bg/map/main{self.event.map_bottom_id}.arc", self.btm_bg.bg,
                                 sprite_sheet=False)
         self.btm_bg.set_tint([15, 5, 0, 120])
         self.btm_bg.fade(2, None, True)
 
-        self.waiter = EventWaiter()
-        self.event_sound = EventSound()
-
-        self.characters: List[Optional[EventCharacter]] = [None]*8
-
         for i in range(8):
             if self.event.characters[i] == 0:
                 continue
@@ -51,14 +66,9 @@ class EventPlayer(TwoScreenRenderer):
             char = EventCharacter(char_id, slot, anim, visibility, self.sprite_loader)
             self.characters[i] = char
 
-        self.dialogue = EventDialogue(self, position=pg.Vector2(0, 192//2 + 3),
-                                      center=pg.Vector2(k4pg.Alignment.CENTER, k4pg.Alignment.BOTTOM))
         self.sprite_loader.load("data_lt2/ani/event/twindow.ani", self.dialogue, True)
         self.dialogue.init_text(self.font_loader)
-
-        self.inp = k4pg.Input()
-
-        # self.run_events_until_busy()
+        self.started = True
 
     def run_events_until_busy(self):
         while True:
@@ -226,6 +236,11 @@ class EventPlayer(TwoScreenRenderer):
                 character.set_anim(command_split[2].replace("_", " "))
 
     def update(self, dt: float):
+        if not self.started:
+            # Wait for the assets of the first frame, which are decoded in the background
+            if not self.prefetcher.first_frame_ready():
+                return
+            self._start()
         for character in self.characters:
             if character is not None:
                 character.update_fade(dt)
@@ -242,6 +257,9 @@ class EventPlayer(TwoScreenRenderer):
         super(EventPlayer, self).update(dt)
 
     def draw(self):
+        if not self.started:
+            self.clear()
+            return
         self.top_bg.draw_back(self.top_camera)
         self.top_bg.draw_front(self.top_camera)
 
@@ -254,6 +272,7 @@ class EventPlayer(TwoScreenRenderer):
         super(EventPlayer, self).draw()
 
     def unload(self):
+        self.prefetcher.cancel()
         self.dialogue.unload()
         self.event_sound.stop_smdl()
         self.event_sound.stop_sadl()
@@ -0,0 +1,270 @@
+import copy
+import io
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import k4pg
+from formats.event import Event
+from formats.sound import sadl
+from formats.sound import swdl
+from formats.sound.smdl import smdl
+from pg_utils.rom import rom_extract
+from pg_utils.rom.loaders import FontLoaderROM, SpriteLoaderROM, prefetch_executor
+
+
+def scan_event_assets(event: Event) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Finds the sprites, backgrounds and sounds an event uses when it's played.
+
+    Parameters
+    ----------
+    event : Event
+        The event to scan, along with its script.
+
+    Returns
+    -------
+    Tuple[List[str], List[str], List[str]]
+        The paths of the assets shown on the first frame (backgrounds, characters and dialogue window), the paths of
+        the ones loaded by the script later on (background changes and names of the talking characters) and the paths
+        of the sounds played by the script (voice lines, sound effects and music), in the order they are used. The
+        event characters are listed by their main sprite and the music by its SMD file.
+    """
+    first_frame = [
+        f"data_lt2/bg/event/sub{event.map_top_id}.arc",
+        f"data_lt2/bg/map/main{event.map_bottom_id}.arc",
+        "data_lt2/ani/event/twindow.ani",
+    ]
+    char_ids = [char_id for char_id in event.characters if char_id != 0]
+    first_frame += [f"data_lt2/ani/eventchr/chr{char_id}.arc" for char_id in char_ids]
+
+    later = []
+    sounds = []
+    next_voice = -1
+    next_dialogue_sfx = -1
+    for command in event.gds.commands:
+        if not command.params:
+            continue
+        if command.command in [0x21, 0x22]:
+            later.append(f"data_lt2/bg/{command.params[0]}")
+        elif command.command == 0x4:
+            dialogue_gds = event.get_text(command.params[0])
+            if dialogue_gds is None or len(dialogue_gds.params) != 5:
+                continue
+            # The player only shows the name of the characters present in the event
+            if dialogue_gds.params[0] in char_ids:
+                later.append(f"data_lt2/ani/eventchr/?/chr{dialogue_gds.params[0]}_n.arc")
+            text = dialogue_gds.params[4]
+            # The voice has a line for each part of the dialogue between pauses
+            if next_voice != -1:
+                sounds += [f"data_lt2/stream/event/?/{str(next_voice).zfill(3)}_{pause}.SAD"
+                           for pause in range(text.count("@p") + 1)]
+            if next_dialogue_sfx != -1 and "@s" in text:
+                sounds.append(f"data_lt2/stream/ST_{str(next_dialogue_sfx).zfill(3)}.SAD")
+            next_voice = -1
+            next_dialogue_sfx = -1
+        elif command.command == 0x5c:
+            next_voice = command.params[0]
+        elif command.command == 0x5d:
+            sounds.append(f"data_lt2/stream/ST_{str(command.params[0]).zfill(3)}.SAD")
+        elif command.command == 0x62:
+            sounds.append(f"data_lt2/sound/BG_{str(command.params[0]).zfill(3)}.SMD")
+        elif command.command == 0x99:
+            next_dialogue_sfx = command.params[0]
+    later = [path for i, path in enumerate(later) if path not in later[:i] and path not in first_frame]
+    sounds = [path for i, path in enumerate(sounds) if path not in sounds[:i]]
+    return first_frame, later, sounds
+
+
+class EventPrefetcher:
+    """
+    Decodes the sprites, backgrounds, font and sounds of an event in the background, so that the event player doesn't
+    stall while loading them.
+
+    All the files are read from the ROM at once when starting, before the player is rendered. The prefetch workers
+    only decompress, decode and parse the data read, without accessing the ROM. The only files read afterwards are
+    the mouths of the characters, whose paths are known once their sprites are decoded.
+    """
+    def __init__(self, event: Event, sprite_loader: k4pg.SpriteLoader, font_loader: k4pg.FontLoader):
+        """
+        Parameters
+        ----------
+        event : Event
+            The event which is going to be played.
+        sprite_loader : k4pg.SpriteLoader
+            The loader the event player is going to load the sprites with. Nothing is prefetched unless it's a
+            SpriteLoaderROM.
+        font_loader : k4pg.FontLoader
+            The loader the event player is going to load the font with.
+        """
+        self.sprite_loader = sprite_loader
+        self.font_loader = font_loader
+        self.first_frame, self.later, self.sounds = scan_event_assets(event)
+        self.tasks: List[Future] = []
+        """Tasks which have been started."""
+
+        self._first_frame_tasks: List[Future] = []
+        self._character_tasks: List[Future] = []
+        """Tasks of the characters whose mouths haven't been prefetched yet."""
+        self._sound_tasks: Dict[str, List[Future]] = {}
+        """Tasks parsing the sounds by their path in the ROM."""
+
+    def start(self):
+        """
+        Reads all the assets of the event from the ROM and starts decoding them, without waiting for them.
+        """
+        if not isinstance(self.sprite_loader, SpriteLoaderROM):
+            return
+        for path in self.first_frame:
+            task = self._prefetch(self.sprite_loader, path)
+            if task is None:
+                continue
+            self._first_frame_tasks.append(task)
+            if path.startswith("data_lt2/ani/eventchr/chr"):
+                self._character_tasks.append(task)
+        if isinstance(self.font_loader, FontLoaderROM):
+            task = self._prefetch(self.font_loader, "fontevent")
+            if task is not None:
+                self._first_frame_tasks.append(task)
+        for path in self.later:
+            self._prefetch(self.sprite_loader, path)
+        for path in self.sounds:
+            self._prefetch_sound(path)
+
+    def first_frame_ready(self) -> bool:
+        """
+        Checks whether the assets of the first frame have been decoded, without waiting for them.
+
+        Returns
+        -------
+        bool
+            True once all the assets of the first frame are decoded, or if nothing is being prefetched.
+        """
+        if self._character_tasks:
+            if not all(task.done() for task in self._character_tasks):
+                return False
+            for task in self._character_tasks:
+                data = self._result(task)
+                if data is not None and data[3].get("child_image", "") != "":
+                    sub_task = self._prefetch(self.sprite_loader, f"data_lt2/ani/sub/{data[3]['child_image']}")
+                    if sub_task is not None:
+                        self._first_frame_tasks.append(sub_task)
+            self._character_tasks = []
+        return all(task.done() for task in self._first_frame_tasks)
+
+    def load_sadl(self, path: str) -> Optional[sadl.SADL]:
+        """
+        Gets a SADL sound of the event, parsed in the background if it was prefetched.
+
+        Parameters
+        ----------
+        path : str
+            Path of the sound, as passed to rom_extract.load_sadl.
+
+        Returns
+        -------
+        Optional[sadl.SADL]
+            The sound, ready to be decoded from the start, or None if it isn't found.
+        """
+        tasks = self._sound(path)
+        if tasks is None or (parsed := self._result(tasks[0])) is None:
+            return rom_extract.load_sadl(path)
+        # Each play decodes its own copy, the data of the sound is shared and only read
+        sound = copy.copy(parsed)
+        sound.reset_decoding()
+        return sound
+
+    def load_smd(self, path: str) -> tuple:
+        """
+        Gets a SMD music of the event along with its sample banks, parsed in the background if it was prefetched.
+
+        Parameters
+        ----------
+        path : str
+            Path of the music, as passed to rom_extract.load_smd.
+
+        Returns
+        -------
+        tuple
+            The SMDL, its SWDL and the SWDL of the sample bank, as returned by rom_extract.load_smd. They are shared
+            between plays and shouldn't be modified.
+        """
+        tasks = self._sound(path)
+        if tasks is None:
+            return rom_extract.load_smd(path)
+        parsed = tuple(self._result(task) for task in tasks)
+        if None in parsed:
+            return rom_extract.load_smd(path)
+        return parsed
+
+    def cancel(self):
+        """
+        Cancels the decoding of the assets which haven't been started.
+        """
+        for task in self.tasks:
+            task.cancel()
+
+    def _prefetch(self, loader, path: str) -> Optional[Future]:
+        try:
+            task = loader.prefetch(path)
+        except Exception as e:  # the asset is read again when loaded
+            logging.exception(e)
+            return None
+        if task is not None:
+            self.tasks.append(task)
+        return task
+
+    def _prefetch_sound(self, path: str):
+        rom = self.sprite_loader.rom
+        path = self._sound_path(path)
+        if path.endswith(".SMD"):
+            paths = [path, path.split(".")[0] + ".SWD", "/".join(path.split("/")[:-1]) + "/BG_999.SWD"]
+            parsers = [self._parse_smd, self._parse_swd, self._parse_swd]
+        else:
+            paths = [path]
+            parsers = [self._parse_sadl]
+        # Missing sounds, such as voice lines of dialogues without voice, are left to the player
+        if any(file_path not in rom.file_index for file_path in paths):
+            return
+        tasks = []
+        for file_path, parser in zip(paths, parsers):
+            # The sample bank is shared by all the music
+            shared = self._sound_tasks.get(file_path)
+            if shared is not None:
+                tasks.append(shared[0])
+                continue
+            with rom.open(file_path, "rb") as file:
+                task = prefetch_executor.submit(parser, file.read())
+            self.tasks.append(task)
+            self._sound_tasks[file_path] = [task]
+            tasks.append(task)
+        self._sound_tasks[path] = tasks
+
+    def _sound(self, path: str) -> Optional[List[Future]]:
+        if not self._sound_tasks:  # nothing is prefetched without a ROM
+            return None
+        return self._sound_tasks.get(self._sound_path(path))
+
+    def _sound_path(self, path: str) -> str:
+        return path.replace("?", self.sprite_loader.rom.lang)
+
+    @staticmethod
+    def _parse_sadl(data: bytes) -> sadl.SADL:
+        return sadl.SADL(file=io.BytesIO(data), compressed=0)
+
+    @staticmethod
+    def _parse_smd(data: bytes) -> smdl.SMDL:
+        return smdl.SMDL(file=io.BytesIO(data))
+
+    @staticmethod
+    def _parse_swd(data: bytes) -> swdl.SWDL:
+        return swdl.SWDL(file=io.BytesIO(data))
+
+    @staticmethod
+    def _result(task: Future) -> Any:
+        if task.cancelled():
+            return None
+        if task.exception() is not None:
+            logging.error("Error prefetching event asset", exc_info=task.exception())
+            return None
+        return task.result()
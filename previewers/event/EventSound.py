@@ -1,17 +1,21 @@
 import pg_utils.sound.SADLStreamPlayer
 import pg_utils.sound.SMDLStreamPlayer
-from pg_utils.rom.rom_extract import load_sadl, load_smd
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .EventPrefetch import EventPrefetcher
 
 
 class EventSound:
-    def __init__(self):
+    def __init__(self, prefetcher: 'EventPrefetcher'):
+        self.prefetcher = prefetcher
         self.sadl_player = pg_utils.sound.SADLStreamPlayer.SADLStreamPlayer(loops=False)
         self.sadl_player.set_volume(0.5)
         self.bg_player = pg_utils.sound.SMDLStreamPlayer.SMDLStreamPlayer(loops=True)
         self.bg_player.set_volume(0.3)
 
     def play_smdl(self, path, vol):
-        smd_obj, swd_file, sample_bank = load_smd(path)
+        smd_obj, swd_file, sample_bank = self.prefetcher.load_smd(path)
         if smd_obj is None or swd_file is None or sample_bank is None:
             return
         self.bg_player.create_temporal_sf2(swd_file, sample_bank)
@@ -23,7 +27,7 @@ class EventSound:
         self.bg_player.stop()
 
     def play_sadl(self, path):
-        sadl = load_sadl(path)
+        sadl = self.prefetcher.load_sadl(path)
         if sadl is not None:
             self.sadl_player.load_sound(sadl)
             self.sadl_player.play()
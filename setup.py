@@ -5,7 +5,7 @@ import Cython.Compiler.Options
 Cython.Compiler.Options.annotate = True
 
 setup(
-    ext_modules=cythonize("formats/sound/compression/*.pyx",
+    ext_modules=cythonize(["formats/sound/compression/*.pyx", "formats/compression/*.pyx"],
                           include_path=[numpy.get_include()],
                           annotate=True),
     include_dirs=[numpy.get_include()],
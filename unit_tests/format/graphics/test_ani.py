@@ -7,6 +7,7 @@ from formats.binary import BinaryReader
 import unittest
 import os
 import hashlib
+import numpy as np
 
 
 class TestAniSprite(unittest.TestCase):
@@ -38,3 +39,23 @@ class TestAniSprite(unittest.TestCase):
         # We build the sub ani sprites using a different method, so the files
         # aren't identical
         assert hashlib.md5(exported_data).hexdigest() == "fe1e3155f643f5c95eea76faa0e5dd65"
+
+
+class TestAniParts(unittest.TestCase):
+    def test_parts_round_trip(self):
+        rng = np.random.default_rng(0)
+        for sprite_class in [AniSprite, AniSubSprite]:
+            for color_depth in [8, 4]:
+                images = [rng.integers(0, 1 << color_depth, shape, dtype=np.uint8)
+                          for shape in [(8, 8), (20, 33), (60, 100), (3, 5), (130, 70)]]
+                ani_obj = sprite_class(compressed=0)
+                ani_obj.color_depth = color_depth
+                ani_obj.images = images
+                ani_obj.palette = np.zeros((1 << color_depth, 4), np.uint8)
+                ani_obj.animations = []
+                exported_file = binary.BinaryWriter()
+                ani_obj.write_stream(exported_file)
+
+                ani_obj = sprite_class(compressed=0)
+                ani_obj.read_stream(BinaryReader(exported_file.data))
+                assert all((image == original).all() for image, original in zip(ani_obj.images, images))
@@ -0,0 +1,21 @@
+from formats.graphics.palette import pack_palette, unpack_palette
+import numpy as np
+import ndspy.color
+import unittest
+
+
+class TestPalette(unittest.TestCase):
+    def test_unpack(self):
+        colors = np.arange(0x10000, dtype=np.uint16)[::7]
+        expected = [tuple(ndspy.color.unpack255(color)) for color in colors.tolist()]
+        assert [tuple(color) for color in unpack_palette(colors).tolist()] == expected
+
+    def test_pack(self):
+        palette = np.random.default_rng(0).integers(0, 256, (0x1000, 4), dtype=np.uint8)
+        palette[0] = 255
+        original = palette.copy()
+        assert pack_palette(palette).tolist() == [ndspy.color.pack255(*color) for color in palette.tolist()]
+        assert pack_palette(palette[:, :3]).tolist() == [ndspy.color.pack255(*color[:3], 0)
+                                                        for color in palette.tolist()]
+        assert (palette == original).all()
+        assert (pack_palette(unpack_palette(np.arange(0x10000, dtype=np.uint16))) == np.arange(0x10000)).all()
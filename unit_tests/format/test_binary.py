@@ -0,0 +1,72 @@
+from formats.binary import BinaryReader, BinaryWriter
+import numpy as np
+import unittest
+import tempfile
+import io
+
+
+class TestBinary(unittest.TestCase):
+    def test_reader_sources(self):
+        wtr = BinaryWriter()
+        wtr.write_uint16(0x1234)
+        wtr.write_int32(-5)
+        wtr.write_string("layton")
+        wtr.write_struct("HB", 7, 8)
+        data = wtr.data
+        for source in [data, bytearray(data), memoryview(data), io.BytesIO(data)]:
+            rdr = BinaryReader(source)
+            assert rdr.read_uint16() == 0x1234
+            assert rdr.read_int32() == -5
+            assert rdr.read_string() == "layton"
+            assert rdr.read_struct("HB") == (7, 8)
+            # Reading past the end returns None, as the stream backed reader does
+            assert rdr.read_uint32() is None and rdr.tell() == len(data)
+            rdr.seek(-4, io.SEEK_CUR)
+            assert rdr.read_uint8() == data[-4]
+
+    def test_arrays(self):
+        frame = np.dtype([("index", np.uint16), ("duration", np.uint32)])
+        frames = np.array([(1, 10), (2, 20), (0, 30)], frame)
+        wtr = BinaryWriter()
+        wtr.write_array(np.arange(6, dtype=">u2").reshape((2, 3)))
+        wtr.write_array(frames)
+        data = wtr.data
+        assert data[:4] == b"\0\0\1\0" and len(data) == 12 + 3 * 6
+
+        for source in [data, io.BytesIO(data)]:
+            rdr = BinaryReader(source)
+            values = rdr.read_array(np.uint16, 6)
+            assert values.tolist() == list(range(6)) and not values.flags.writeable
+            assert (rdr.read_array(frame, 3) == frames).all()
+            assert rdr.read_array(np.uint8, 1) is None and rdr.tell() == len(data)
+
+    def test_writer_size(self):
+        with tempfile.TemporaryFile() as file:
+            for stream in [None, file]:
+                wtr = BinaryWriter(stream) if stream else BinaryWriter()
+                wtr.write_zeros(0x10)
+                wtr.seek(4)
+                wtr.write_uint32(0x10)
+                assert len(wtr) == 0x10 and wtr.tell() == 8
+                with wtr.getbuffer() as buffer:
+                    assert buffer[4:8] == b"\x10\0\0\0"
+                wtr.seek(0, io.SEEK_END)
+                wtr.write_uint8(1)
+                assert len(wtr) == 0x11 and wtr.data[-1] == 1
+
+        # The data of in-memory wrappers isn't copied when taken
+        wtr = BinaryWriter()
+        wtr.write_zeros(0x100000)
+        assert wtr.data is wtr.data
+        data = bytes(0x100)
+        assert BinaryReader(data).data is data
+
+    def test_strings(self):
+        data = b"title\0" + "ナゾ".encode("shift_jis") + b"\0unterminated"
+        for source in [data, memoryview(data), io.BytesIO(data)]:
+            rdr = BinaryReader(source)
+            assert rdr.read_string() == "title"
+            assert rdr.read_string(encoding=None) == "ナゾ".encode("shift_jis")
+            assert rdr.read_string() == "unterminated" and rdr.tell() == len(data)
+            assert rdr.read_cstrings([6, 0, 11]) == ["ナゾ", "title", "unterminated"]
+            assert rdr.tell() == len(data)
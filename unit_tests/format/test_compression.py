@@ -0,0 +1,144 @@
+import formats.compression as compression
+from formats.binary import BinaryReader
+from formats.filesystem import CompressedIOWrapper, FileFormat
+from formats import conf
+import unittest
+import random
+import tempfile
+import io
+
+
+class TestCompression(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        rng = random.Random(0)
+        cls.payloads = [bytes(rng.choice(b"layton\0") for _ in range(0x800 + i * 0x100)) for i in range(4)]
+
+    def test_compress_many(self):
+        serial = [compression.compress(payload, compression.LZ10, double_typed=i % 2 == 1)
+                  for i, payload in enumerate(self.payloads)]
+        parallel = compression.compress_many(self.payloads, compression.LZ10,
+                                             double_typed=[i % 2 == 1 for i in range(len(self.payloads))],
+                                             workers=2)
+        assert parallel == serial
+
+    def test_compression_cache(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            conf.COMPRESSION_CACHE_PATH = cache_path
+            try:
+                cache = compression.get_compression_cache()
+                first = compression.compress_many(self.payloads, compression.LZ10, double_typed=True, workers=1)
+                assert cache.misses == len(self.payloads) and cache.hits == 0
+                second = compression.compress_many(self.payloads, compression.LZ10, double_typed=True, workers=1)
+                assert second == first
+                assert cache.hits == len(self.payloads)
+                assert compression.compress(self.payloads[0], compression.LZ10, double_typed=True) == first[0]
+                assert cache.hits == len(self.payloads) + 1
+
+                # Shrink the cache to fit a single entry, the least recently used entries are evicted
+                cache.max_size = len(first[0])
+                cache.put(cache.key(self.payloads[0], compression.LZ10, True), first[0])
+                assert len(cache) == 1 and cache.size <= cache.max_size
+            finally:
+                conf.COMPRESSION_CACHE_PATH = None
+
+    @unittest.skipIf(compression.lz10 is None, "native LZ10 codec not built")
+    def test_compression_cache_levels(self):
+        level = conf.LZ10_COMPRESSION_LEVEL
+        with tempfile.TemporaryDirectory() as cache_path:
+            conf.COMPRESSION_CACHE_PATH = cache_path
+            try:
+                # Each level has its own entries, switching levels doesn't return the output of the other
+                for lz10_level in [compression.lz10.FAST, compression.lz10.OPTIMAL]:
+                    conf.LZ10_COMPRESSION_LEVEL = lz10_level
+                    for _ in range(2):
+                        compressed = compression.compress(self.payloads[0], compression.LZ10, double_typed=False)
+                        assert compressed == compression.lz10.compress(self.payloads[0], lz10_level)
+                cache = compression.get_compression_cache()
+                assert len(cache) == 2 and cache.hits == 2
+            finally:
+                conf.COMPRESSION_CACHE_PATH = None
+                conf.LZ10_COMPRESSION_LEVEL = level
+
+    @unittest.skipIf(compression.lz10 is None, "native LZ10 codec not built")
+    def test_native_lz10(self):
+        import ndspy.lz10
+        for payload in self.payloads + [b"", b"ab", b"\0" * 0x1000]:
+            for level in [compression.lz10.FAST, compression.lz10.OPTIMAL]:
+                compressed = compression.lz10.compress(payload, level)
+                assert ndspy.lz10.decompress(compressed) == payload
+            optimal = compression.lz10.compress(payload, compression.lz10.OPTIMAL)
+            assert len(optimal) <= len(ndspy.lz10.compress(payload))
+            assert compression.lz10.decompress(ndspy.lz10.compress(payload)) == payload
+
+    def test_huffman(self):
+        for payload in self.payloads:
+            for datablock_size in [4, 8]:
+                compressed = compression.huffman.compress(payload, datablock_size)
+                assert compression.huffman.decompress(compressed) == payload
+            smallest = min(compression.huffman.compress(payload, 4), compression.huffman.compress(payload, 8), key=len)
+            assert compression.huffman.compress(payload) == smallest
+
+    def test_rle(self):
+        assert compression.rle.compress(b"aaaaabc") == bytes.fromhex("300700008261016263")
+        rng = random.Random(0)
+        payload = b"".join(bytes([rng.randrange(4)]) * rng.choice([1, 2, 3, 129, 130, 131, 133]) for _ in range(0x2000))
+        for data in self.payloads + [payload, b""]:
+            assert compression.rle.decompress(compression.rle.compress(data)) == data
+
+    def test_decompress_chunks(self):
+        payload = b"".join(self.payloads)
+        for compression_type in [compression.LZ10, compression.RLE, compression.HUFF4BIT, compression.HUFF8BIT]:
+            compressed = compression.compress(payload, compression_type, double_typed=True)
+            chunks, double_typed = compression.decompress_chunks(compressed, True, chunk_size=0x400)
+            assert b"".join(chunks) == payload and double_typed
+
+            wrapper = CompressedIOWrapper(io.BytesIO(compressed), double_typed=True, lazy=True)
+            assert wrapper.read(0x10) == payload[:0x10]
+            wrapper.seek(0x1000)
+            assert wrapper.read(0x10) == payload[0x1000:0x1010]
+            assert wrapper.getvalue() == payload
+            self.assertRaises(io.UnsupportedOperation, wrapper.write, b"data")
+
+    def test_lazy_reader(self):
+        payload = b"".join(self.payloads) * 0x20
+        compressed = compression.compress(payload, compression.RLE, double_typed=True)
+        wrapper = CompressedIOWrapper(io.BytesIO(compressed), double_typed=True, lazy=True)
+        # The reader reads through the wrapper, which only decompresses as far as it is read
+        rdr = BinaryReader(wrapper)
+        assert rdr.read_uint32() == int.from_bytes(payload[:4], "little")
+        assert 0 < wrapper._decompressed_size < len(payload)
+        rdr.seek(len(payload) - 4)
+        assert rdr.read(4) == payload[-4:] and wrapper._decompressed_size == len(payload)
+
+    def test_file_format_decompression(self):
+        class Format(FileFormat):
+            _compressed_default = 2
+
+            def read_stream(self, stream):
+                self.eager = stream.getvalue_is_cheap
+                self.value = BinaryReader(stream).read_uint32()
+
+        compressed = compression.compress(self.payloads[0], compression.LZ10, double_typed=True)
+        # Formats decompress the whole file unless they opt in, so that they are read from memory
+        loaded = Format(file=io.BytesIO(compressed))
+        assert loaded.eager and loaded.value == int.from_bytes(self.payloads[0][:4], "little")
+        Format._lazy_decompression = True
+        assert not Format(file=io.BytesIO(compressed)).eager
+
+    def test_best_compression(self):
+        compression.take_best_compression_report()
+        flat = b"\x01" * 0x800 + b"\x02" * 0x800
+        for payload in self.payloads + [flat]:
+            best = compression.compress(payload, compression.BEST, double_typed=True)
+            sizes = [len(compression.compress(payload, compression_type, double_typed=True))
+                     for compression_type in compression.SECOND_TYPES]
+            assert len(best) == min(sizes)
+            assert compression.decompress(best, True)[0] == payload
+            # Files which aren't double typed can only be LZ10
+            assert compression.compress(payload, compression.BEST, double_typed=False) == \
+                   compression.compress(payload, compression.LZ10, double_typed=False)
+        report = compression.take_best_compression_report()
+        assert report.payloads == 2 * (len(self.payloads) + 1)
+        assert report.bytes_saved > 0 and report.chosen_types.get(compression.RLE) == 1
+        assert compression.best_compression_report.payloads == 0
@@ -0,0 +1,267 @@
+from formats.filesystem import NintendoDSRom, PlzArchive, PlzMemberList, ArchiveCache
+from formats import conf
+import unittest
+import tempfile
+import io
+import os
+import gc
+
+
+class TestNintendoDSRom(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        rom_path = os.path.dirname(__file__)
+        cls.rom_path = rom_path + "/../../test_rom.nds"
+        cls.rom = NintendoDSRom.fromFile(cls.rom_path)
+
+    def test_mapped_loading(self):
+        mapped_rom = NintendoDSRom.fromFile(self.rom_path, mapped=True)
+        assert len(mapped_rom.files) == len(self.rom.files)
+        assert all(bytes(mapped) == original for mapped, original in zip(mapped_rom.files, self.rom.files))
+        assert mapped_rom.save() == self.rom.save()
+
+    def test_file_index(self):
+        rom = NintendoDSRom.fromFile(self.rom_path)
+        for file_id in range(len(rom.files)):
+            path = rom.filenames.filenameOf(file_id)
+            if path is None:  # overlays
+                continue
+            assert rom.file_index.id_of(path) == file_id
+            assert rom.file_index.path_of(file_id) == path
+        assert "data_lt2/bg/map/main0.arc" in rom.file_index
+        assert rom.file_index.find_case_insensitive("DATA_LT2/BG/MAP/MAIN0.ARC") == "data_lt2/bg/map/main0.arc"
+        assert all(path.startswith("data_lt2/bg/map/") for path in rom.file_index.with_prefix("/data_lt2/bg/map/"))
+
+        with rom.open("data_lt2/bg/map/new_bg.arc", "wb+") as f:
+            f.write(b"data")
+        rom.rename_file("data_lt2/bg/map/new_bg.arc", "renamed_bg.arc")
+        assert rom.file_index.id_of("data_lt2/bg/map/renamed_bg.arc") == \
+               rom.filenames.idOf("data_lt2/bg/map/renamed_bg.arc")
+        rom.remove_file("data_lt2/bg/map/renamed_bg.arc")
+        assert "data_lt2/bg/map/renamed_bg.arc" not in rom.file_index
+        assert rom.file_index.id_of("data_lt2/bg/map/main0.arc") == rom.filenames.idOf("data_lt2/bg/map/main0.arc")
+
+    def test_save_skips_clean_archives(self):
+        rom = NintendoDSRom.fromFile(self.rom_path)
+        original_data = rom.save()
+        archive = rom.get_archive("/data_lt2/script/puzzle.plz")
+        with archive.open("q3_param.gds", "rb") as f:
+            gds_data = f.read()
+        with archive.open("q3_param.gds", "wb") as f:
+            f.write(gds_data)
+        assert not archive.is_dirty
+        assert rom.save() == original_data
+        assert rom.last_save_summary.archives_rewritten == 0
+        assert rom.last_save_summary.files_rewritten == 0
+
+
+class TestRomBatch(unittest.TestCase):
+    @staticmethod
+    def make_rom():
+        rom = NintendoDSRom()
+        for folder in ["a", "b", "a/c"]:
+            rom.add_folder(folder)
+        for i, path in enumerate(["a/x", "b/y", "a/z", "a/c/w", "b/v"]):
+            with rom.open(path, "wb+") as f:
+                f.write(bytes([i]))
+        rom.clear_dirty()
+        return rom
+
+    @staticmethod
+    def change(rom):
+        with rom.open("b/added", "wb+") as f:
+            f.write(b"added")
+        rom.remove_file("a/x")
+        rom.add_folder("d")
+        with rom.open("d/new", "wb+") as f:
+            f.write(b"new")
+        rom.move_file("b/y", "a/c/y")
+        rom.remove_file("a/c/w")
+        with rom.open("a/z", "wb") as f:
+            f.write(b"z")
+
+    def test_batch(self):
+        expected = self.make_rom()
+        self.change(expected)
+        rom = self.make_rom()
+        with rom.batch() as batch:
+            self.change(rom)
+            assert rom.open("a/c/y").read() == b"\1" and "a/c/y" not in rom.file_index
+            self.assertRaises(FileNotFoundError, rom.open, "a/x")
+            # Added files can be opened by their temporary id
+            with rom.open(batch.file_id("d/new")) as f:
+                assert f.read() == b"new"
+        assert rom.files == expected.files and str(rom.filenames) == str(expected.filenames)
+        assert rom.dirty_files == expected.dirty_files
+        assert [rom.file_index.id_of(path) for path in ["a/c/y", "b/added", "d/new"]] == \
+               [expected.file_index.id_of(path) for path in ["a/c/y", "b/added", "d/new"]]
+
+    def test_file_version(self):
+        rom = self.make_rom()
+        version = rom.file_version("a/z")
+        with rom.open("a/z", "wb") as f:
+            f.write(b"\2")  # same data
+        assert rom.file_version("a/z") == version
+        with rom.open("a/z", "wb") as f:
+            f.write(b"changed")
+        assert rom.file_version("a/z") != version
+        version = rom.file_version("b/y")
+        with rom.batch():
+            rom.open("b/new", "wb+").close()
+        assert rom.file_version("b/y") != version and rom.file_version("b/missing") is None
+
+
+class TestDeduplication(unittest.TestCase):
+    def test_deduplicate_files(self):
+        rom = NintendoDSRom()
+        rom.add_folder("bg")
+        payloads = [b"\1" * 0x300, b"\2" * 0x300, b"\1" * 0x300, b"", b"\1" * 0x300, b""]
+        for i, payload in enumerate(payloads):
+            with rom.open(f"bg/{i}.arc", "wb+") as f:
+                f.write(payload)
+        full = rom.save()
+        conf.DEDUPLICATE_FILES = True
+        try:
+            deduplicated = rom.save()
+        finally:
+            conf.DEDUPLICATE_FILES = False
+        assert rom.last_save_summary.files_deduplicated == 2
+        assert rom.last_save_summary.bytes_deduplicated == 0x600
+        assert len(deduplicated) < len(full) - 0x600
+        assert NintendoDSRom(deduplicated).files == NintendoDSRom(full).files == payloads
+
+
+class TestSaveInPlace(unittest.TestCase):
+    def test_save_in_place(self):
+        rom = NintendoDSRom()
+        rom.add_folder("bg")
+        for i in range(5):
+            with rom.open(f"bg/{i}.arc", "wb+") as f:
+                f.write(bytes([i % 4]) * 0x300)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rom.nds")
+            conf.DEDUPLICATE_FILES = True  # 0.arc and 4.arc share their data
+            try:
+                rom.saveToFile(path)
+            finally:
+                conf.DEDUPLICATE_FILES = False
+            size = os.path.getsize(path)
+
+            rom = NintendoDSRom.fromFile(path)
+            for name, data in [("1", b"small"), ("2", b"2" * 0x1000), ("4", b"4" * 0x300)]:
+                with rom.open(f"bg/{name}.arc", "wb") as f:
+                    f.write(data)
+            rom.rename_file("bg/3.arc", "three.arc")
+            rom.saveToFile(path, in_place=True)
+            assert rom.last_save_summary.files_moved == 2
+            saved = NintendoDSRom.fromFile(path)
+            assert saved.files == rom.files and str(saved.filenames) == str(rom.filenames)
+            assert os.path.getsize(path) < size + 0x1000 + 0x300 + 0x400
+
+            # Adding files changes the ids of the files, which needs a full save
+            rom.open("bg/new.arc", "wb+").close()
+            rom.saveToFile(path, in_place=True)
+            assert rom.last_save_summary.files_moved is None
+            assert NintendoDSRom.fromFile(path).files == rom.files
+
+    def test_save_mapped_in_use(self):
+        rom = NintendoDSRom()
+        rom.add_folder("bg")
+        for i in range(3):
+            with rom.open(f"bg/{i}.arc", "wb+") as f:
+                f.write(bytes([i]) * 0x300)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rom.nds")
+            rom.saveToFile(path)
+            for in_place in [False, True]:
+                rom = NintendoDSRom.fromFile(path, mapped=True)
+                kept = rom.files[1][:0x10]  # keeps the map in use
+                with rom.open("bg/0.arc", "wb") as f:
+                    f.write(b"changed")
+                rom.saveToFile(path, in_place=in_place)
+                assert NintendoDSRom.fromFile(path).files == [bytes(file) for file in rom.files]
+                assert bytes(kept) == b"\1" * 0x10
+                kept.release()
+
+
+class TestPlzArchive(unittest.TestCase):
+    def test_name_index(self):
+        plz = PlzArchive(compressed=0)
+        plz.filenames = ["m1_2.txt", "t10_20_100.gds", "m1_0.txt", "m10_0.txt"]
+        plz.files = [b"", b"", b"", b""]
+        assert plz.index_of("m1_0.txt") == 2 and "m1_0.txt" in plz and "m1_1.txt" not in plz
+        assert plz.with_prefix("m1_") == ["m1_2.txt", "m1_0.txt"]
+        assert plz.glob("m*_0.txt") == ["m1_0.txt", "m10_0.txt"]
+
+        plz.remove_file("m1_2.txt")
+        plz.rename_file("m10_0.txt", "m1_1.txt")
+        assert plz.add_file("t10_20_200.gds") == 3
+        assert plz.filenames == ["t10_20_100.gds", "m1_0.txt", "m1_1.txt", "t10_20_200.gds"]
+        assert [plz.index_of(filename) for filename in plz.filenames] == [0, 1, 2, 3]
+        assert plz.with_prefix("m1_") == ["m1_0.txt", "m1_1.txt"]
+        assert plz.glob("t10_20_*.gds") == ["t10_20_100.gds", "t10_20_200.gds"]
+        with plz.open("m1_1.txt", "wb") as file:
+            file.write(b"subtitle")
+        assert plz.files[2] == b"subtitle"
+
+    def test_lazy_members(self):
+        source = PlzArchive(compressed=0)
+        source.filenames = ["a.txt", "b.txt", "c.txt"]
+        source.files = [b"first", b"", b"third file"]
+        expected = PlzArchive(compressed=0)
+        expected.filenames = ["b.txt", "c.txt", "d.txt"]
+        expected.files = [b"second", b"third file", b""]
+        for lazy in [False, True]:
+            conf.LAZY_PLZ_MEMBERS = lazy
+            try:
+                plz = PlzArchive(file=io.BytesIO(source.to_bytes()), compressed=0)
+            finally:
+                conf.LAZY_PLZ_MEMBERS = True
+            assert isinstance(plz.files, PlzMemberList) == lazy
+            assert [bytes(file) for file in plz.files] == source.files and plz.to_bytes() == source.to_bytes()
+
+            with plz.open("b.txt", "wb") as file:
+                file.write(b"second")
+            plz.remove_file("a.txt")
+            plz.add_file("d.txt")
+            assert [bytes(file) for file in plz.files] == expected.files and plz.dirty_files == {0, 2}
+            assert plz.to_bytes() == expected.to_bytes()
+
+    def test_archive_cache(self):
+        archives = {}
+        for name in "abc":
+            archives[name] = PlzArchive(compressed=0)
+            archives[name].filenames = [f"{name}.txt"]
+            archives[name].files = [b"0123456789"]
+        cache = ArchiveCache(25)
+        cache.put("a", archives["a"])
+        cache.put("b", archives["b"])
+        assert cache.get("a") is archives["a"] and cache.get("c") is None
+        assert cache.hits == 1 and cache.misses == 1
+
+        # The least recently used archive is evicted, unless it has been modified
+        archives["a"].mark_dirty(0)
+        cache.get("b")
+        cache.put("c", archives["c"])
+        assert "a" in cache and "b" not in cache and cache.size == 20 and cache.evictions == 1
+        assert archives["b"] in cache.archives()
+        archives["a"].clear_dirty()
+        cache.evict()
+        assert "a" in cache and cache.evictions == 1
+
+        # Evicted archives still referenced are returned again, the rest are released
+        assert cache.get("b") is archives["b"] and "a" not in cache
+        del archives["a"]
+        gc.collect()
+        assert cache.get("a") is None and len(cache.archives()) == 2
+
+        # Evicted archives modified through another reference are cached again, so that they are saved
+        cache = ArchiveCache(15)
+        cache.put("a", archives["b"])
+        cache.put("c", archives["c"])
+        assert "a" not in cache
+        with archives["b"].open("b.txt", "wb") as f:
+            f.write(b"changed")
+        del archives["b"]
+        gc.collect()
+        assert "a" in cache and [archive.files[0] for archive in cache.archives()] == [b"0123456789", b"changed"]